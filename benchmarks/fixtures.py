@@ -0,0 +1,89 @@
+import json
+import random
+import hashlib
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.parse import urlparse
+
+FIXTURES_DIR = Path(__file__).parent / 'fixtures'
+INDEX_FILE = FIXTURES_DIR / 'index.json'
+
+WORDS = (
+    "музей выставка экспозиция коллекция театр спектакль премьера концерт парк прогулка "
+    "экскурсия билеты расписание афиша художник картина скульптура история космос "
+    "ресторан кухня меню кофе десерт фестиваль программа площадка адрес телефон"
+).split()
+
+def host_of(url: str) -> str:
+    return urlparse(url).netloc
+
+def _load_index() -> Dict[str, str]:
+    if INDEX_FILE.exists():
+        return json.loads(INDEX_FILE.read_text(encoding='utf-8'))
+    return {}
+
+def synthetic_page(host: str, paragraphs: int = 60) -> Tuple[bytes, str]:
+    """Детерминированная страница для хоста, для которого нет записанной фикстуры"""
+    rnd = random.Random(host)
+    # Каждый третий сайт - cp1251 без charset в заголовке, как у старых сайтов
+    legacy = rnd.random() < 0.33
+    encoding = 'cp1251' if legacy else 'utf-8'
+
+    body = [f"<p>{' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(20, 60))).capitalize()}.</p>"
+            for _ in range(paragraphs)]
+    html = (
+        f"<html><head><meta charset=\"{encoding}\"><title>{host}</title>"
+        f"<script>var data = {list(range(200))};</script><style>p {{ margin: 0 }}</style></head>"
+        f"<body><header>Меню сайта</header><h1>{host.split('.')[0].capitalize()} — главная</h1>"
+        f"<main>{''.join(body)}<p>Адрес: ул. Тверская, 7. Тел: +7 (495) 123-45-67. info@{host}</p></main>"
+        f"<footer>© {host}</footer></body></html>"
+    )
+    content_type = 'text/html' if legacy else 'text/html; charset=utf-8'
+    return html.encode(encoding), content_type
+
+def fixtures_digest(urls: List[str]) -> Dict[str, object]:
+    """Хеш страниц, на которых идет замер: результаты сравнимы, только если он совпадает"""
+    hosts = sorted({host_of(url) for url in urls})
+    digest = hashlib.sha256()
+    for host in hosts:
+        body, content_type = load_fixture(f"http://{host}/")
+        digest.update(f"{host}\0{content_type}\0{len(body)}\0".encode())
+        digest.update(body)
+
+    stored = sum((FIXTURES_DIR / f"{host}.html").exists() for host in hosts)
+    return {"sha256": digest.hexdigest()[:16], "stored": stored, "generated": len(hosts) - stored}
+
+def load_fixture(url: str) -> Tuple[bytes, str]:
+    """Записанная страница сайта (или синтетическая, если записи нет) и ее Content-Type"""
+    host = host_of(url)
+    path = FIXTURES_DIR / f"{host}.html"
+    if path.exists():
+        return path.read_bytes(), _load_index().get(host, 'text/html')
+    return synthetic_page(host)
+
+async def record_fixtures(urls: List[str]):
+    """Сохраняет текущие версии страниц сайтов в фикстуры"""
+    import aiohttp
+
+    FIXTURES_DIR.mkdir(exist_ok=True)
+    index = _load_index()
+
+    async with aiohttp.ClientSession(headers={'User-Agent': 'Mozilla/5.0'}) as session:
+        async def record(url: str):
+            try:
+                async with session.get(url, timeout=15, ssl=False) as response:
+                    body = await response.read()
+                    if response.status != 200:
+                        print(f"⚠️ {url}: статус {response.status}")
+                        return
+                    host = host_of(url)
+                    (FIXTURES_DIR / f"{host}.html").write_bytes(body)
+                    index[host] = response.headers.get('Content-Type', 'text/html')
+                    print(f"✅ {url}: {len(body)} байт")
+            except Exception as e:
+                print(f"❌ {url}: {e}")
+
+        await asyncio.gather(*(record(url) for url in urls))
+
+    INDEX_FILE.write_text(json.dumps(index, ensure_ascii=False, indent=2, sort_keys=True), encoding='utf-8')
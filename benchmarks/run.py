@@ -0,0 +1,219 @@
+"""Офлайн-бенчмарки: парсинг, загрузка, кэш и полный путь рекомендаций.
+
+Запуск из корня проекта:
+    python -m benchmarks.run                      # все замеры
+    python -m benchmarks.run --output base.json   # сохранить результат
+    python -m benchmarks.run --compare base.json  # сравнить с прошлым коммитом
+    python -m benchmarks.run --record             # записать фикстуры с реальных сайтов
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import subprocess
+from typing import Dict, Any, List
+
+# Бенчмарк не требует .env: подставляем значения по умолчанию до импорта config
+for key, value in {'REDIS_HOST': 'localhost', 'REDIS_PORT': '6379', 'LLM_MODEL': 'fake', 'CRAWL_ENABLED': '0'}.items():
+    os.environ.setdefault(key, value)
+
+from config import config
+from fake_llm_client import FakeLLMClient
+from services import WebParser, CacheService, LLMService
+from benchmarks.fixtures import load_fixture, record_fixtures, fixtures_digest
+from benchmarks.server import FixtureServer
+
+CATEGORY_SETS = [
+    ["🏛️ Музеи"],
+    ["🎭 Театры/Концерты", "🏞️ Парки/Прогулки"],
+    ["🍽️ Рестораны/Кафе", "☕ Кофейни", "🎨 Искусство/Выставки"],
+]
+
+def all_urls() -> List[str]:
+    return [url for urls in config.URL_DATABASE.values() for url in urls]
+
+def summarize(samples: List[float], wall_time: float) -> Dict[str, Any]:
+    """Пропускная способность и перцентили задержки в миллисекундах"""
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        index = min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))
+        return round(ordered[index] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "throughput": round(len(ordered) / wall_time, 2) if wall_time else 0.0,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+    }
+
+async def bench_parse(iterations: int) -> Dict[str, Any]:
+    parser = WebParser()
+    pages = [(url, *load_fixture(url)) for url in all_urls()]
+    samples = []
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for url, body, content_type in pages:
+            t0 = time.perf_counter()
+            header_charset = content_type.split('charset=')[-1] if 'charset=' in content_type else None
+            parser.parse_page_content(body, url, parser._detect_encoding(body, header_charset))
+            samples.append(time.perf_counter() - t0)
+
+    return summarize(samples, time.perf_counter() - started)
+
+async def bench_fetch(server: FixtureServer, iterations: int) -> Dict[str, Any]:
+    urls = [server.local_url(url) for url in all_urls()]
+    samples = []
+
+    async def timed_fetch(parser: WebParser, url: str):
+        t0 = time.perf_counter()
+        await parser.fetch_page(url)
+        samples.append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    async with WebParser() as parser:
+        for _ in range(iterations):
+            await asyncio.gather(*(timed_fetch(parser, url) for url in urls))
+
+    return summarize(samples, time.perf_counter() - started)
+
+async def bench_cache(iterations: int) -> Dict[str, Any]:
+    cache = CacheService()
+    if not cache.redis:
+        return None
+
+    value = "Рекомендации: музеи, выставки и театры Москвы. " * 80
+    samples = []
+    keys = []
+
+    started = time.perf_counter()
+    for i in range(iterations * 50):
+        key = cache.get_cache_key("bench", str(i))
+        keys.append(key)
+        t0 = time.perf_counter()
+        cache.set(key, value, ttl=60)
+        cache.get(key)
+        samples.append(time.perf_counter() - t0)
+    wall_time = time.perf_counter() - started
+
+    cache.redis.delete(*keys)
+    return summarize(samples, wall_time)
+
+async def bench_end_to_end(server: FixtureServer, iterations: int, llm_latency: float) -> Dict[str, Any]:
+    service = LLMService(
+        client=FakeLLMClient(latency=llm_latency),
+        cache=CacheService(enabled=False),
+        url_database=server.rewrite(config.URL_DATABASE)
+    )
+    # Рейтинг источников берется из БД; в офлайн-режиме используем порядок из конфига
+    service._source_ranking = {}
+    service._source_ranking_at = float('inf')
+
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for categories in CATEGORY_SETS:
+            t0 = time.perf_counter()
+            await service.get_recommendations(categories)
+            samples.append(time.perf_counter() - t0)
+
+    return summarize(samples, time.perf_counter() - started)
+
+def current_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except Exception:
+        return "unknown"
+
+def print_report(report: Dict[str, Any], baseline: Dict[str, Any] = None):
+    fixtures = report.get('fixtures') or {}
+    print(f"\n📊 Бенчмарк {report['commit']} ({report['python']}), фикстуры {fixtures.get('sha256', '?')} "
+          f"(из файлов {fixtures.get('stored', 0)}, сгенерировано {fixtures.get('generated', 0)})")
+    print(f"{'путь':<12}{'N':>7}{'оп/с':>12}{'p50, мс':>12}{'p95, мс':>12}{'p99, мс':>12}")
+
+    for path, result in report['results'].items():
+        if result is None:
+            print(f"{path:<12}{'пропущено (нет Redis)':>40}")
+            continue
+
+        print(f"{path:<12}{result['count']:>7}{result['throughput']:>12}"
+              f"{result['p50_ms']:>12}{result['p95_ms']:>12}{result['p99_ms']:>12}")
+
+        previous = (baseline or {}).get('results', {}).get(path)
+        if previous:
+            deltas = []
+            for metric in ('throughput', 'p50_ms', 'p95_ms', 'p99_ms'):
+                if previous[metric]:
+                    deltas.append(f"{metric} {100 * (result[metric] - previous[metric]) / previous[metric]:+.1f}%")
+            print(f"{'':<12}vs {baseline['commit']}: {', '.join(deltas)}")
+
+async def run(args) -> Dict[str, Any]:
+    results = {}
+
+    if 'parse' in args.paths:
+        results['parse'] = await bench_parse(args.iterations)
+    if 'cache' in args.paths:
+        results['cache'] = await bench_cache(args.iterations)
+
+    server = FixtureServer(all_urls(), latency=args.server_latency)
+    await server.start()
+    try:
+        if 'fetch' in args.paths:
+            results['fetch'] = await bench_fetch(server, args.iterations)
+        if 'e2e' in args.paths:
+            results['e2e'] = await bench_end_to_end(server, args.iterations, args.llm_latency)
+    finally:
+        await server.stop()
+
+    return {
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "fixtures": fixtures_digest(all_urls()),
+        "params": {
+            "iterations": args.iterations,
+            "llm_latency": args.llm_latency,
+            "server_latency": args.server_latency,
+        },
+        "results": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарки бота рекомендаций")
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="задержка фейкового LLM, с")
+    parser.add_argument('--server-latency', type=float, default=0.0, help="задержка локальных сайтов, с")
+    parser.add_argument('--paths', nargs='+', default=['parse', 'fetch', 'cache', 'e2e'],
+                        choices=['parse', 'fetch', 'cache', 'e2e'])
+    parser.add_argument('--output', help="сохранить результат в JSON")
+    parser.add_argument('--compare', help="JSON с прошлым результатом для сравнения")
+    parser.add_argument('--record', action='store_true', help="записать фикстуры с реальных сайтов")
+    args = parser.parse_args()
+
+    if args.record:
+        asyncio.run(record_fixtures(all_urls()))
+        return
+
+    report = asyncio.run(run(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('params') != report['params']:
+            print("⚠️ Параметры запуска отличаются от сравниваемого результата", file=sys.stderr)
+        if baseline.get('fixtures', {}).get('sha256') != report['fixtures']['sha256']:
+            print("⚠️ Фикстуры отличаются от сравниваемого результата: замеры на разных страницах", file=sys.stderr)
+
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
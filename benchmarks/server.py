@@ -0,0 +1,52 @@
+import asyncio
+from typing import Dict, List
+
+from aiohttp import web
+
+from benchmarks.fixtures import host_of, load_fixture
+
+class FixtureServer:
+    """Локальный HTTP-сервер, отдающий записанные страницы вместо реальных сайтов"""
+
+    def __init__(self, urls: List[str], latency: float = 0.0):
+        self.pages = {host_of(url): load_fixture(url) for url in urls}
+        self.latency = latency
+        self.base_url = None
+        self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        page = self.pages.get(request.match_info['host'])
+        if page is None:
+            return web.Response(status=404)
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        body, content_type = page
+        response = web.Response(body=body, headers={'Content-Type': content_type})
+        response.enable_compression()
+        return response
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get('/{host}/', self._handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def local_url(self, url: str) -> str:
+        return f"{self.base_url}/{host_of(url)}/"
+
+    def rewrite(self, url_database: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """База ссылок, указывающая на локальный сервер"""
+        return {category: [self.local_url(url) for url in urls] for category, urls in url_database.items()}
@@ -0,0 +1,67 @@
+import json
+import zlib
+import base64
+from typing import Any, Dict
+
+from config import config
+
+class JsonCodec:
+    """Компактный JSON без экранирования кириллицы (\\uXXXX занимает 6 байт вместо 2)"""
+
+    version = '\x01'
+    name = 'json'
+
+    def dumps(self, payload: bytes) -> str:
+        return payload.decode()
+
+    def loads(self, data: str) -> bytes:
+        return data.encode()
+
+class ZlibJsonCodec(JsonCodec):
+    """Сжатый JSON; base85, т.к. Redis (decode_responses) и дисковый кэш хранят текст"""
+
+    version = '\x02'
+    name = 'zlib'
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def dumps(self, payload: bytes) -> str:
+        return base64.b85encode(zlib.compress(payload, self.level)).decode('ascii')
+
+    def loads(self, data: str) -> bytes:
+        return zlib.decompress(base64.b85decode(data))
+
+class CacheCodec:
+    """Сериализация значений кэша: байт версии + тело.
+
+    Записи без байта версии - старый формат (json.dumps или сырой текст), читаются как раньше.
+    """
+
+    def __init__(self, threshold: int = None, level: int = None):
+        self.threshold = config.CACHE_COMPRESS_THRESHOLD if threshold is None else threshold
+        self.plain = JsonCodec()
+        self.compressed = ZlibJsonCodec(level or config.CACHE_COMPRESS_LEVEL)
+        self.codecs: Dict[str, JsonCodec] = {codec.version: codec for codec in (self.plain, self.compressed)}
+
+    def encode(self, value: Any) -> str:
+        payload = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+
+        if self.threshold and len(payload) >= self.threshold:
+            encoded = self.compressed.dumps(payload)
+            # Несжимаемые данные выгоднее хранить как есть
+            if len(encoded) < len(payload):
+                return self.compressed.version + encoded
+
+        return self.plain.version + self.plain.dumps(payload)
+
+    def decode(self, data: str, legacy_json: bool = True) -> Any:
+        """legacy_json=False - старые записи были сырым текстом, а не JSON"""
+        codec = self.codecs.get(data[:1])
+        if codec is None:
+            return json.loads(data) if legacy_json else data
+        return json.loads(codec.loads(data[1:]))
+
+    def codec_name(self, data: str) -> str:
+        codec = self.codecs.get(data[:1])
+        return codec.name if codec else 'legacy'
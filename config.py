@@ -18,6 +18,85 @@ class Config:
     REDIS_HOST = os.getenv('REDIS_HOST')
     REDIS_PORT = int(os.getenv('REDIS_PORT'))
     LLM_MODEL = os.getenv('LLM_MODEL')
+    # Дешевая модель для анализа предпочтений; mistral или fake (локальная заглушка)
+    LLM_MODEL_CHEAP = os.getenv('LLM_MODEL_CHEAP') or LLM_MODEL
+    LLM_BACKEND = os.getenv('LLM_BACKEND', 'mistral')
+    # Дублирующий запрос отправляется после p95 бэкенда; до накопления статистики - после этой задержки, с
+    LLM_HEDGE_AFTER = float(os.getenv('LLM_HEDGE_AFTER', 8.0))
+    
+    # Лимиты отправки сообщений Telegram
+    SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', 30))
+    SEND_CHAT_INTERVAL = float(os.getenv('SEND_CHAT_INTERVAL', 1.0))
+    
+    # Локальный эндпоинт метрик Prometheus (0 - отключить)
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 9100))
+    
+    # Порог блокировки event loop, после которого логируется стек, с
+    LOOP_STALL_THRESHOLD = float(os.getenv('LOOP_STALL_THRESHOLD', 0.25))
+    
+    # Минимальная релевантность, при которой /search отвечает из индекса без LLM
+    SEARCH_MIN_SCORE = float(os.getenv('SEARCH_MIN_SCORE', 0.3))
+    
+    # Рейтинг источников: байесовское среднее с априорной оценкой
+    RATING_PRIOR_MEAN = 3.0
+    RATING_PRIOR_WEIGHT = 5
+    SOURCES_PER_CATEGORY = int(os.getenv('SOURCES_PER_CATEGORY', 3))
+    SOURCE_RANKING_TTL = 300
+    
+    # Геопоиск: источники без геокодированных мест относятся к своему городу (по хосту) или к городу по умолчанию;
+    # рекомендации по геопозиции кэшируются на ячейку геохеша точности GEO_CACHE_PRECISION (~20 км)
+    DEFAULT_SOURCE_CITY = os.getenv('DEFAULT_SOURCE_CITY', 'Москва')
+    SOURCE_CITIES = {
+        "hermitagemuseum.org": "Санкт-Петербург",
+        "rusmuseum.ru": "Санкт-Петербург",
+        "mikhailovsky.ru": "Санкт-Петербург",
+        "mariinsky.ru": "Санкт-Петербург",
+        "mdt-dodin.ru": "Санкт-Петербург",
+    }
+    GEO_CACHE_PRECISION = 4
+    
+    # Дисковый кэш страниц и рекомендаций под Redis (пустой путь - отключить)
+    DISK_STORE_PATH = os.getenv('DISK_STORE_PATH', 'data/cache.sqlite3')
+    DISK_STORE_MAX_MB = int(os.getenv('DISK_STORE_MAX_MB', 200))
+    
+    # Значения кэша длиннее порога (байт JSON) сжимаются zlib; 0 - не сжимать
+    CACHE_COMPRESS_THRESHOLD = int(os.getenv('CACHE_COMPRESS_THRESHOLD', 1024))
+    CACHE_COMPRESS_LEVEL = 6
+    
+    # Рекомендации свежи REC_FRESH_TTL, затем еще REC_STALE_TTL отдаются сразу с фоновым обновлением
+    REC_FRESH_TTL = int(os.getenv('REC_FRESH_TTL', 3600))
+    REC_STALE_TTL = int(os.getenv('REC_STALE_TTL', 6 * 3600))
+    
+    # Если SimHash страниц отличается не больше чем на SIMHASH_MAX_DISTANCE бит, прошлый текст
+    # продлевается без LLM, но не дольше REC_FINGERPRINT_TTL с момента генерации
+    SIMHASH_MAX_DISTANCE = int(os.getenv('SIMHASH_MAX_DISTANCE', 4))
+    REC_FINGERPRINT_TTL = int(os.getenv('REC_FINGERPRINT_TTL', 24 * 3600))
+    
+    # Фоновый обход сайтов: подстраницы (афиши, выставки) на глубину до CRAWL_MAX_DEPTH
+    CRAWL_ENABLED = os.getenv('CRAWL_ENABLED', '1') == '1'
+    CRAWL_INTERVAL = int(os.getenv('CRAWL_INTERVAL', 600))
+    CRAWL_MAX_DEPTH = 2
+    CRAWL_MAX_PAGES_PER_HOST = int(os.getenv('CRAWL_MAX_PAGES_PER_HOST', 30))
+    CRAWL_PAGES_PER_RUN = int(os.getenv('CRAWL_PAGES_PER_RUN', 200))
+    CRAWL_LINKS_PER_PAGE = 10
+    CRAWL_HOST_DELAY = float(os.getenv('CRAWL_HOST_DELAY', 2.0))
+    CRAWL_HOST_CONCURRENCY = 8
+    CRAWL_REFRESH_INTERVAL = 6 * 3600
+    CRAWL_MAX_REFRESH_INTERVAL = 7 * 24 * 3600
+    
+    # Кэш ролей: версия в Redis сверяется раз в ROLE_CHECK_INTERVAL, без Redis роли перечитываются по TTL
+    ROLE_CHECK_INTERVAL = int(os.getenv('ROLE_CHECK_INTERVAL', 10))
+    ROLE_CACHE_TTL = int(os.getenv('ROLE_CACHE_TTL', 300))
+    
+    # Новые пользователи из /start пишутся в БД пачками
+    USER_FLUSH_INTERVAL = float(os.getenv('USER_FLUSH_INTERVAL', 1.0))
+    USER_FLUSH_BATCH = 100
+    # Недавние пользователи, чей повторный /start не пишется в БД; остальные вставятся повторно (ON CONFLICT DO NOTHING)
+    USER_KNOWN_CACHE_SIZE = int(os.getenv('USER_KNOWN_CACHE_SIZE', 100_000))
+    
+    # Сколько сайтов одновременно опрашивается при массовом импорте
+    IMPORT_CONCURRENCY = int(os.getenv('IMPORT_CONCURRENCY', 20))
     
     # Категории
     CATEGORIES = [
@@ -0,0 +1,393 @@
+import time
+import asyncio
+import hashlib
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Tuple, Optional
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+from xml.etree import ElementTree
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from config import config
+from database import Session, CrawlPage
+from services import WebParser
+
+logger = logging.getLogger(__name__)
+
+ROBOTS_AGENT = 'KudaShoditBot'
+# Сайты видят тот же токен, по которому мы читаем robots.txt
+CRAWLER_USER_AGENT = f'Mozilla/5.0 (compatible; {ROBOTS_AGENT}/1.0)'
+
+# Разделы, ради которых стоит идти вглубь сайта
+PRIORITY_KEYWORDS = (
+    'афиш', 'выставк', 'событи', 'спектакл', 'концерт', 'экскурс', 'расписан', 'меню', 'программ',
+    'afisha', 'exhibition', 'event', 'schedule', 'playbill', 'menu', 'program',
+)
+
+SKIPPED_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.zip', '.doc', '.docx', '.xls', '.xlsx', '.mp4')
+
+def _host(url: str) -> str:
+    return urlparse(url).netloc.lower().removeprefix('www.')
+
+def _link_priority(url: str, anchor: str) -> int:
+    haystack = f"{url} {anchor}".lower()
+    return sum(keyword in haystack for keyword in PRIORITY_KEYWORDS)
+
+class CrawlStore:
+    """Фронтир обхода в PostgreSQL"""
+
+    # На это время взятая страница скрыта от других процессов; если процесс упал, ее возьмут снова
+    CLAIM_SECONDS = 3600
+
+    @staticmethod
+    def seed(url_database: Dict[str, List[str]]):
+        """Корневые страницы источников; уже известные не трогаем"""
+        rows = [
+            {"url": url, "source_url": url, "category": category, "depth": 0,
+             "refresh_interval": config.CRAWL_REFRESH_INTERVAL}
+            for category, urls in url_database.items()
+            for url in urls
+        ]
+        if not rows:
+            return
+
+        with Session() as session:
+            session.execute(insert(CrawlPage).values(rows).on_conflict_do_nothing(index_elements=['url']))
+            session.commit()
+
+    @staticmethod
+    def claim_due_pages(limit: int) -> List[Dict[str, Any]]:
+        """Забирает страницы, которые пора (пере)загрузить: сначала корни и мелкие уровни.
+
+        SKIP LOCKED и сдвиг next_crawl_at не дают нескольким процессам бота обходить одни и те же страницы.
+        """
+        now = datetime.utcnow()
+        with Session() as session:
+            pages = (
+                session.query(CrawlPage)
+                .filter(CrawlPage.next_crawl_at <= now)
+                .order_by(CrawlPage.depth, CrawlPage.next_crawl_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            claimed = [
+                {"id": p.id, "url": p.url, "source_url": p.source_url, "category": p.category,
+                 "depth": p.depth, "content_hash": p.content_hash, "refresh_interval": p.refresh_interval}
+                for p in pages
+            ]
+            for p in pages:
+                p.next_crawl_at = now + timedelta(seconds=CrawlStore.CLAIM_SECONDS)
+            session.commit()
+        return claimed
+
+    @staticmethod
+    def _host_page_count(session, source_url: str) -> int:
+        return session.query(func.count(CrawlPage.id)).filter_by(source_url=source_url).scalar()
+
+    @staticmethod
+    def _add_pages(session, page: Dict[str, Any], urls: List[str], depth: int, lastmods: Dict[str, datetime] = None):
+        budget = config.CRAWL_MAX_PAGES_PER_HOST - CrawlStore._host_page_count(session, page["source_url"])
+        rows = [
+            {"url": url, "source_url": page["source_url"], "category": page["category"], "depth": depth,
+             "lastmod": (lastmods or {}).get(url), "refresh_interval": config.CRAWL_REFRESH_INTERVAL}
+            for url in urls[:max(0, budget)]
+        ]
+        if rows:
+            session.execute(insert(CrawlPage).values(rows).on_conflict_do_nothing(index_elements=['url']))
+
+    @staticmethod
+    def record_result(page: Dict[str, Any], parsed: Dict[str, Any], content_hash: str, links: List[str]):
+        """Сохраняет результат загрузки; неизмененные страницы проверяются все реже"""
+        now = datetime.utcnow()
+        changed = content_hash != page["content_hash"]
+        interval = (
+            config.CRAWL_REFRESH_INTERVAL if changed
+            else min(page["refresh_interval"] * 2, config.CRAWL_MAX_REFRESH_INTERVAL)
+        )
+
+        values = {
+            "http_status": "200",
+            "error_count": 0,
+            "last_crawled_at": now,
+            "refresh_interval": interval,
+            "next_crawl_at": now + timedelta(seconds=interval),
+        }
+        if changed:
+            values.update({
+                "title": parsed["title"][:300],
+                "content": parsed["content"],
+                "content_hash": content_hash,
+                "last_changed_at": now,
+            })
+
+        with Session() as session:
+            session.query(CrawlPage).filter_by(id=page["id"]).update(values)
+            if links:
+                CrawlStore._add_pages(session, page, links, page["depth"] + 1)
+            session.commit()
+
+    @staticmethod
+    def record_failure(page: Dict[str, Any], status: str):
+        """Экспоненциальная пауза для недоступных страниц"""
+        with Session() as session:
+            crawl_page = session.get(CrawlPage, page["id"])
+            crawl_page.error_count += 1
+            crawl_page.http_status = status
+            crawl_page.last_crawled_at = datetime.utcnow()
+            backoff = config.CRAWL_REFRESH_INTERVAL * 2 ** min(crawl_page.error_count, 5)
+            crawl_page.next_crawl_at = datetime.utcnow() + timedelta(seconds=min(backoff, config.CRAWL_MAX_REFRESH_INTERVAL))
+            session.commit()
+
+    @staticmethod
+    def apply_sitemap(page: Dict[str, Any], entries: List[Tuple[str, Optional[datetime]]]) -> int:
+        """Ставит в очередь страницы, у которых в sitemap свежий lastmod; добавляет новые по приоритету"""
+        now = datetime.utcnow()
+        lastmods = dict(entries)
+
+        with Session() as session:
+            known = session.query(CrawlPage).filter(CrawlPage.url.in_(list(lastmods))).all()
+            refreshed = 0
+            for crawl_page in known:
+                lastmod = lastmods[crawl_page.url]
+                if lastmod and (crawl_page.lastmod is None or lastmod > crawl_page.lastmod):
+                    crawl_page.lastmod = lastmod
+                    if crawl_page.last_crawled_at is None or lastmod > crawl_page.last_crawled_at:
+                        crawl_page.next_crawl_at = now
+                        refreshed += 1
+
+            known_urls = {crawl_page.url for crawl_page in known}
+            new_urls = sorted(
+                (url for url in lastmods if url not in known_urls),
+                key=lambda url: (_link_priority(url, ''), lastmods[url] or datetime.min),
+                reverse=True
+            )
+            CrawlStore._add_pages(session, page, new_urls, 1, lastmods)
+            session.commit()
+        return refreshed
+
+    @staticmethod
+    def subpages_for_sources(source_urls: List[str], per_source: int = 2) -> List[Dict[str, Any]]:
+        """Уже загруженные подстраницы источников, самые свежие изменения первыми"""
+        with Session() as session:
+            pages = (
+                session.query(CrawlPage.url, CrawlPage.title, CrawlPage.content, CrawlPage.source_url)
+                .filter(CrawlPage.source_url.in_(source_urls), CrawlPage.depth > 0, CrawlPage.content.isnot(None))
+                .order_by(CrawlPage.last_changed_at.desc())
+                .all()
+            )
+
+        taken = Counter()
+        result = []
+        for url, title, content, source_url in pages:
+            if taken[source_url] < per_source and len(content) > 50:
+                taken[source_url] += 1
+                result.append({"url": url, "title": title, "content": content})
+        return result
+
+class Crawler:
+    """Фоновый инкрементальный обход источников с учетом robots.txt и sitemap.xml"""
+
+    SITEMAP_INTERVAL = 24 * 3600
+    SITEMAP_MAX_ENTRIES = 2000
+    # robots.txt не ответил: хост пропускаем до следующей попытки
+    ROBOTS_RETRY_INTERVAL = 3600
+
+    def __init__(self):
+        # Хост -> (когда прочитан, правила); правила перечитываются раз в SITEMAP_INTERVAL
+        self._robots: Dict[str, Tuple[float, Optional[RobotFileParser]]] = {}
+        self._robots_backoff: Dict[str, float] = {}
+        self._sitemaps_checked: Dict[str, float] = {}
+
+    async def run_forever(self):
+        while True:
+            try:
+                stats = await self.run_once()
+                if stats:
+                    logger.info(f"🕷️ Обход: {dict(stats)}")
+            except Exception as e:
+                logger.error(f"❌ Ошибка обхода: {e}")
+            await asyncio.sleep(config.CRAWL_INTERVAL)
+
+    async def run_once(self) -> Counter:
+        await asyncio.to_thread(CrawlStore.seed, config.URL_DATABASE)
+        due = await asyncio.to_thread(CrawlStore.claim_due_pages, config.CRAWL_PAGES_PER_RUN)
+
+        by_host = defaultdict(list)
+        for page in due:
+            by_host[_host(page["url"])].append(page)
+
+        stats = Counter()
+        semaphore = asyncio.Semaphore(config.CRAWL_HOST_CONCURRENCY)
+
+        async with WebParser(user_agent=CRAWLER_USER_AGENT) as parser:
+            async def crawl_host(host: str, pages: List[Dict[str, Any]]):
+                async with semaphore:
+                    root = pages[0]["source_url"]
+                    allowed, robots = await self._get_robots(parser, root)
+                    if not allowed:
+                        # Страницы остаются взятыми на CLAIM_SECONDS и вернутся в очередь позже
+                        stats["robots_unavailable"] += len(pages)
+                        return
+                    await self._check_sitemaps(parser, robots, pages[0], stats)
+
+                    delay = config.CRAWL_HOST_DELAY
+                    if robots and robots.crawl_delay(ROBOTS_AGENT):
+                        delay = max(delay, float(robots.crawl_delay(ROBOTS_AGENT)))
+
+                    for i, page in enumerate(pages):
+                        if i:
+                            await asyncio.sleep(delay)
+                        await self._crawl_page(parser, robots, page, stats)
+
+            await asyncio.gather(*(crawl_host(host, pages) for host, pages in by_host.items()))
+
+        return stats
+
+    async def _get_robots(self, parser: WebParser, root: str) -> Tuple[bool, Optional[RobotFileParser]]:
+        """(можно ли обходить хост, правила robots.txt); нет файла (404 и т.п.) - ограничений нет"""
+        host = _host(root)
+        now = time.monotonic()
+        if now < self._robots_backoff.get(host, 0):
+            return False, None
+
+        cached = self._robots.get(host)
+        if cached and now - cached[0] < self.SITEMAP_INTERVAL:
+            return True, cached[1]
+
+        parsed_root = urlparse(root)
+        robots_url = f"{parsed_root.scheme}://{parsed_root.netloc}/robots.txt"
+        status, text = await self._fetch_robots(parser, robots_url)
+
+        if status == 200:
+            robots = RobotFileParser(robots_url)
+            robots.parse(text.splitlines())
+        elif status in (401, 403):
+            # Как в urllib.robotparser: закрытый robots.txt запрещает весь сайт
+            robots = RobotFileParser(robots_url)
+            robots.disallow_all = True
+        elif status is not None and 400 <= status < 500:
+            robots = None
+        else:
+            # Таймаут или 5xx: правила неизвестны, поэтому не обходим хост, а не разрешаем все
+            logger.warning(f"⚠️ robots.txt {host} недоступен ({status or 'нет ответа'}), хост отложен")
+            self._robots_backoff[host] = now + self.ROBOTS_RETRY_INTERVAL
+            return False, None
+
+        self._robots[host] = (now, robots)
+        return True, robots
+
+    @staticmethod
+    async def _fetch_robots(parser: WebParser, robots_url: str) -> Tuple[Optional[int], str]:
+        """HTTP-статус (None, если ответа нет) и текст robots.txt"""
+        try:
+            async with parser.session.get(robots_url, timeout=10, ssl=False) as response:
+                text = await response.text(errors='replace') if response.status == 200 else ""
+                return response.status, text
+        except Exception as e:
+            logger.debug(f"robots.txt {robots_url}: {e}")
+            return None, ""
+
+    async def _check_sitemaps(self, parser: WebParser, robots: Optional[RobotFileParser], page: Dict[str, Any], stats: Counter):
+        host = _host(page["source_url"])
+        if time.monotonic() - self._sitemaps_checked.get(host, -self.SITEMAP_INTERVAL) < self.SITEMAP_INTERVAL:
+            return
+        self._sitemaps_checked[host] = time.monotonic()
+
+        parsed_root = urlparse(page["source_url"])
+        sitemap_urls = (robots.site_maps() if robots else None) or [f"{parsed_root.scheme}://{parsed_root.netloc}/sitemap.xml"]
+
+        entries = []
+        for sitemap_url in sitemap_urls[:3]:
+            entries.extend(await self._read_sitemap(parser, sitemap_url, host))
+
+        entries = [
+            (url, lastmod) for url, lastmod in entries[:self.SITEMAP_MAX_ENTRIES]
+            if not robots or robots.can_fetch(ROBOTS_AGENT, url)
+        ]
+        if entries:
+            stats["sitemap_refreshed"] += await asyncio.to_thread(CrawlStore.apply_sitemap, page, entries)
+
+    async def _read_sitemap(self, parser: WebParser, sitemap_url: str, host: str, nested: bool = False) -> List[Tuple[str, Optional[datetime]]]:
+        """Записи (url, lastmod) из sitemap или sitemap index (один уровень вложенности)"""
+        text = await parser.fetch_url(sitemap_url)
+        if not text:
+            return []
+
+        try:
+            root = ElementTree.fromstring(text.encode())
+        except ElementTree.ParseError:
+            return []
+
+        entries = []
+        for element in root:
+            tag = element.tag.rsplit('}', 1)[-1]
+            fields = {child.tag.rsplit('}', 1)[-1]: (child.text or '').strip() for child in element}
+            loc = fields.get('loc')
+            if not loc:
+                continue
+
+            if tag == 'sitemap' and not nested:
+                entries.extend(await self._read_sitemap(parser, loc, host, nested=True))
+            elif tag == 'url' and _host(loc) == host:
+                entries.append((loc, self._parse_lastmod(fields.get('lastmod'))))
+
+            if len(entries) >= self.SITEMAP_MAX_ENTRIES:
+                break
+        return entries
+
+    @staticmethod
+    def _parse_lastmod(value: Optional[str]) -> Optional[datetime]:
+        if not value:
+            return None
+        try:
+            lastmod = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        if lastmod.tzinfo:
+            lastmod = lastmod.astimezone(timezone.utc).replace(tzinfo=None)
+        return lastmod
+
+    async def _crawl_page(self, parser: WebParser, robots: Optional[RobotFileParser], page: Dict[str, Any], stats: Counter):
+        if robots and not robots.can_fetch(ROBOTS_AGENT, page["url"]):
+            await asyncio.to_thread(CrawlStore.record_failure, page, "robots")
+            stats["blocked"] += 1
+            return
+
+        body, encoding = await parser.fetch_page(page["url"])
+        if not body:
+            await asyncio.to_thread(CrawlStore.record_failure, page, "error")
+            stats["failed"] += 1
+            return
+
+        parsed = await asyncio.to_thread(parser.parse_page_content, body, page["url"], encoding, True)
+        content_hash = hashlib.sha1(parsed["content"].encode()).hexdigest()
+        changed = content_hash != page["content_hash"]
+
+        links = []
+        if changed and page["depth"] < config.CRAWL_MAX_DEPTH:
+            links = self._select_links(parsed.get("links", []), page["url"], robots)
+
+        await asyncio.to_thread(CrawlStore.record_result, page, parsed, content_hash, links)
+        stats["changed" if changed else "unchanged"] += 1
+
+    def _select_links(self, links: List[Tuple[str, str]], page_url: str, robots: Optional[RobotFileParser]) -> List[str]:
+        """Ссылки того же сайта, сначала ведущие в афиши, выставки и т.п."""
+        host = _host(page_url)
+        scored = {}
+        for url, anchor in links:
+            parsed = urlparse(url)
+            if parsed.scheme not in ('http', 'https') or _host(url) != host or url.rstrip('/') == page_url.rstrip('/'):
+                continue
+            if parsed.path.lower().endswith(SKIPPED_EXTENSIONS):
+                continue
+            if robots and not robots.can_fetch(ROBOTS_AGENT, url):
+                continue
+            scored[url] = max(scored.get(url, 0), _link_priority(url, anchor))
+
+        ranked = sorted(scored, key=lambda url: scored[url], reverse=True)
+        return ranked[:config.CRAWL_LINKS_PER_PAGE]
@@ -4,6 +4,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database import Session, User
+from users import set_role
 
 def create_admin_user():
     """Создание администратора через интерактивный ввод"""
@@ -19,31 +20,22 @@ def create_admin_user():
             print("❌ Telegram ID обязателен!")
             return
         
-        session = Session()
-        
-        existing_user = session.query(User).filter_by(telegram_id=telegram_id).first()
+        with Session() as session:
+            existing_user = session.query(User).filter_by(telegram_id=telegram_id).first()
         
         if existing_user:
             print(f"⚠️ Пользователь {telegram_id} уже существует")
             update = input("Сделать администратором? (y/n): ").lower()
             if update == 'y':
-                existing_user.role = 'admin'
-                session.commit()
+                set_role(telegram_id, 'admin')
                 print(f"✅ Пользователь теперь администратор")
             else:
                 print("❌ Отменено")
         else:
-            user = User(
-                telegram_id=telegram_id,
-                username=username or None,
-                role='admin'
-            )
-            session.add(user)
-            session.commit()
+            # set_role сбрасывает кэш ролей работающего бота
+            set_role(telegram_id, 'admin', username or None)
             print(f"✅ Создан администратор ID: {telegram_id}")
         
-        session.close()
-        
     except Exception as e:
         print(f"❌ Ошибка: {e}")
 
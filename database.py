@@ -1,7 +1,9 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Float, Boolean, DateTime, Text, ForeignKey, Index, Computed, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 from datetime import datetime
 import os
+import threading
 from dotenv import load_dotenv
 from config import config
 
@@ -17,6 +19,8 @@ class User(Base):
     username = Column(String(100))
     role = Column(String(20), default='user', nullable=False)
     preferences = Column(Text, default='[]')
+    latitude = Column(Float)
+    longitude = Column(Float)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     reviews = relationship("Review", back_populates="user", cascade="all, delete-orphan")
@@ -24,6 +28,14 @@ class User(Base):
     def __repr__(self):
         return f"<User(id={self.id}, telegram_id={self.telegram_id})>"
 
+# Полнотекстовый индекс мест: название важнее категории, категория важнее описания
+PLACE_SEARCH_VECTOR = (
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(description, '')), 'C') || "
+    "setweight(to_tsvector('russian', coalesce(address, '')), 'D')"
+)
+
 class Place(Base):
     __tablename__ = 'places'
     
@@ -34,13 +46,25 @@ class Place(Base):
     address = Column(String(300))
     rating = Column(Float, default=0.0)
     review_count = Column(Integer, default=0)
+    rating_sum = Column(Integer, default=0, server_default='0', nullable=False)
+    rank_score = Column(Float, default=config.RATING_PRIOR_MEAN)
     source_url = Column(String(500))
+    latitude = Column(Float)
+    longitude = Column(Float)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    search_vector = Column(TSVECTOR, Computed(PLACE_SEARCH_VECTOR, persisted=True))
     
     reviews = relationship("Review", back_populates="place", cascade="all, delete-orphan")
     
+    __table_args__ = (
+        Index('ix_places_search_vector', 'search_vector', postgresql_using='gin'),
+        Index('ix_places_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # Один источник на категорию: повторный импорт после перезапуска не создает дублей
+        Index('ux_places_category_source_url', 'category', 'source_url', unique=True),
+    )
+    
     def __repr__(self):
         return f"<Place(id={self.id}, name='{self.name}')>"
 
@@ -58,13 +82,224 @@ class Review(Base):
     user = relationship("User", back_populates="reviews")
     place = relationship("Place", back_populates="reviews")
     
+    # Один отзыв пользователя на место: повторный заменяет прежний
+    __table_args__ = (
+        Index('ux_reviews_user_place', 'user_id', 'place_id', unique=True),
+    )
+    
     def __repr__(self):
         return f"<Review(id={self.id})>"
 
-engine = create_engine(config.DATABASE_URL)
-Session = sessionmaker(bind=engine)
+class CrawlPage(Base):
+    __tablename__ = 'crawl_pages'
+    
+    id = Column(Integer, primary_key=True)
+    url = Column(String(1000), unique=True, nullable=False)
+    source_url = Column(String(500), nullable=False, index=True)
+    category = Column(String(100))
+    depth = Column(Integer, default=0, nullable=False)
+    title = Column(String(300))
+    content = Column(Text)
+    content_hash = Column(String(40))
+    lastmod = Column(DateTime)
+    http_status = Column(String(20))
+    error_count = Column(Integer, default=0, nullable=False)
+    refresh_interval = Column(Integer, nullable=False)
+    last_crawled_at = Column(DateTime)
+    last_changed_at = Column(DateTime)
+    next_crawl_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<CrawlPage(id={self.id}, url='{self.url}')>"
+
+class StatsCounter(Base):
+    """Счетчики для админ-статистики, поддерживаются триггерами (см. STATS_MIGRATIONS)"""
+    __tablename__ = 'stats_counters'
+    
+    name = Column(String(50), primary_key=True)
+    value = Column(BigInteger, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f"<StatsCounter({self.name}={self.value})>"
+
+_engine = None
+_engine_lock = threading.Lock()
+_session_factory = sessionmaker()
+
+def get_engine():
+    """Ленивое создание движка БД при первом обращении"""
+    global _engine
+    if _engine is None:
+        # Прогрев и хендлеры в потоках могут прийти сюда одновременно: второй пул утек бы
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(config.DATABASE_URL, pool_pre_ping=True)
+                _session_factory.configure(bind=engine)
+                _engine = engine
+    return _engine
+
+def Session():
+    """Открывает сессию БД (движок создается при первом вызове)"""
+    get_engine()
+    return _session_factory()
+
+def dispose_engine():
+    """Закрывает пул соединений при остановке бота"""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+
+# Идемпотентные миграции для уже существующих баз (create_all не меняет таблицы)
+MIGRATIONS = [
+    f"ALTER TABLE places ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    f"GENERATED ALWAYS AS ({PLACE_SEARCH_VECTOR}) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_places_search_vector ON places USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_places_name_trgm ON places USING gin (name gin_trgm_ops)",
+    "ALTER TABLE places ADD COLUMN IF NOT EXISTS rating_sum INTEGER NOT NULL DEFAULT 0",
+    f"ALTER TABLE places ADD COLUMN IF NOT EXISTS rank_score FLOAT DEFAULT {config.RATING_PRIOR_MEAN}",
+    "ALTER TABLE places ADD COLUMN IF NOT EXISTS latitude FLOAT",
+    "ALTER TABLE places ADD COLUMN IF NOT EXISTS longitude FLOAT",
+    # Геохеш мест не использовался: ближайшие источники ищет GeoIndex в памяти
+    "DROP INDEX IF EXISTS ix_places_geohash",
+    "ALTER TABLE places DROP COLUMN IF EXISTS geohash",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS latitude FLOAT",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS longitude FLOAT",
+    # Дубли прошлых импортов: ссылку оставляем у самого раннего места, отзывы остальных не теряем
+    "UPDATE places p SET source_url = NULL FROM places q "
+    "WHERE p.category = q.category AND p.source_url = q.source_url AND p.id > q.id",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_places_category_source_url ON places (category, source_url)",
+    # Повторные отзывы до ограничения: остается последний, агрегаты мест пересчитываются по оставшимся
+    "DELETE FROM reviews r USING reviews n "
+    "WHERE r.user_id = n.user_id AND r.place_id = n.place_id AND r.id < n.id",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_reviews_user_place ON reviews (user_id, place_id)",
+    f"""
+    UPDATE places p
+    SET rating_sum = a.total, review_count = a.reviews, rating = a.total::float / a.reviews,
+        rank_score = (a.total + {config.RATING_PRIOR_MEAN} * {config.RATING_PRIOR_WEIGHT})::float
+                     / (a.reviews + {config.RATING_PRIOR_WEIGHT})
+    FROM (
+        SELECT place_id, count(*) AS reviews, coalesce(sum(rating), 0) AS total FROM reviews GROUP BY place_id
+    ) a
+    WHERE p.id = a.place_id AND (p.review_count IS DISTINCT FROM a.reviews OR p.rating_sum <> a.total)
+    """,
+]
+
+# Имена счетчиков в stats_counters, по одному на колонку STATS_AGGREGATE_SQL
+STATS_COUNTERS = ('users', 'admins', 'places', 'active_places', 'reviews', 'moderated_reviews')
+
+# Все счетчики одним проходом по каждой таблице; используется для заполнения stats_counters
+STATS_AGGREGATE_SQL = """
+    SELECT u.users, u.admins, p.places, p.active_places, r.reviews, r.moderated_reviews
+    FROM (
+        SELECT count(*) AS users, count(*) FILTER (WHERE role = 'admin') AS admins FROM users
+    ) u, (
+        SELECT count(*) AS places, count(*) FILTER (WHERE is_active) AS active_places FROM places
+    ) p, (
+        SELECT count(*) AS reviews, count(*) FILTER (WHERE is_moderated) AS moderated_reviews FROM reviews
+    ) r
+"""
+
+# Триггеры меняют счетчики на дельту каждой строки, поэтому чтение статистики не зависит от размера таблиц
+STATS_MIGRATIONS = [
+    """
+    CREATE OR REPLACE FUNCTION stats_bump(counter TEXT, delta BIGINT) RETURNS void LANGUAGE sql AS $$
+        UPDATE stats_counters SET value = value + delta WHERE name = counter AND delta <> 0
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION stats_count_users() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM stats_bump('users', CASE TG_OP WHEN 'INSERT' THEN 1 WHEN 'DELETE' THEN -1 ELSE 0 END);
+        PERFORM stats_bump('admins',
+            (CASE WHEN TG_OP <> 'DELETE' AND NEW.role = 'admin' THEN 1 ELSE 0 END) -
+            (CASE WHEN TG_OP <> 'INSERT' AND OLD.role = 'admin' THEN 1 ELSE 0 END));
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION stats_count_places() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM stats_bump('places', CASE TG_OP WHEN 'INSERT' THEN 1 WHEN 'DELETE' THEN -1 ELSE 0 END);
+        PERFORM stats_bump('active_places',
+            (CASE WHEN TG_OP <> 'DELETE' AND NEW.is_active THEN 1 ELSE 0 END) -
+            (CASE WHEN TG_OP <> 'INSERT' AND OLD.is_active THEN 1 ELSE 0 END));
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION stats_count_reviews() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM stats_bump('reviews', CASE TG_OP WHEN 'INSERT' THEN 1 WHEN 'DELETE' THEN -1 ELSE 0 END);
+        PERFORM stats_bump('moderated_reviews',
+            (CASE WHEN TG_OP <> 'DELETE' AND NEW.is_moderated THEN 1 ELSE 0 END) -
+            (CASE WHEN TG_OP <> 'INSERT' AND OLD.is_moderated THEN 1 ELSE 0 END));
+        RETURN NULL;
+    END
+    $$
+    """,
+    "DROP TRIGGER IF EXISTS stats_users ON users",
+    "CREATE TRIGGER stats_users AFTER INSERT OR DELETE OR UPDATE OF role ON users "
+    "FOR EACH ROW EXECUTE FUNCTION stats_count_users()",
+    "DROP TRIGGER IF EXISTS stats_places ON places",
+    "CREATE TRIGGER stats_places AFTER INSERT OR DELETE OR UPDATE OF is_active ON places "
+    "FOR EACH ROW EXECUTE FUNCTION stats_count_places()",
+    "DROP TRIGGER IF EXISTS stats_reviews ON reviews",
+    "CREATE TRIGGER stats_reviews AFTER INSERT OR DELETE OR UPDATE OF is_moderated ON reviews "
+    "FOR EACH ROW EXECUTE FUNCTION stats_count_reviews()",
+]
+
+def refresh_stats_counters(conn):
+    """Пересчитывает счетчики с нуля; таблицы блокируются от записи, чтобы не потерять дельты"""
+    conn.execute(text("LOCK TABLE users, places, reviews IN SHARE MODE"))
+    row = conn.execute(text(STATS_AGGREGATE_SQL)).mappings().one()
+    conn.execute(
+        text(
+            "INSERT INTO stats_counters (name, value) VALUES (:name, :value) "
+            "ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value"
+        ),
+        [{"name": name, "value": value} for name, value in row.items()]
+    )
+
+def geocode_places(conn, batch_size: int = 1000) -> int:
+    """Офлайн-геокодирование мест без координат: адрес, затем название и описание"""
+    from geo import geocode
+    
+    rows = conn.execute(text(
+        "SELECT id, address, name, description FROM places WHERE latitude IS NULL"
+    )).fetchall()
+    
+    updates = []
+    for place_id, address, name, description in rows:
+        coordinates = geocode(address or "", name or "", description or "")
+        if coordinates:
+            updates.append({"id": place_id, "lat": coordinates[0], "lon": coordinates[1]})
+    
+    for start in range(0, len(updates), batch_size):
+        conn.execute(
+            text("UPDATE places SET latitude = :lat, longitude = :lon WHERE id = :id"),
+            updates[start:start + batch_size]
+        )
+    return len(updates)
 
 def init_db():
-    """Инициализация базы данных"""
+    """Инициализация базы данных (разовая миграция, запускается через init_db.py)"""
+    engine = get_engine()
+    
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    
     Base.metadata.create_all(engine)
+    
+    with engine.begin() as conn:
+        for statement in MIGRATIONS + STATS_MIGRATIONS:
+            conn.execute(text(statement))
+        refresh_stats_counters(conn)
+        geocoded = geocode_places(conn)
+    
+    print(f"📍 Геокодировано мест: {geocoded}")
     print(f"✅ База данных инициализирована: {config.DATABASE_URL}")
\ No newline at end of file
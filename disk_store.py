@@ -0,0 +1,128 @@
+import os
+import time
+import sqlite3
+import threading
+import logging
+from typing import Optional, Tuple
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+class DiskStore:
+    """Долговременное хранилище ключ-значение в SQLite с вытеснением давно неиспользуемых записей"""
+
+    # accessed_at обновляется не чаще раза в минуту, чтобы чтения не превращались в запись
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_kv_accessed_at ON kv (accessed_at)")
+
+        self._conn.execute("DELETE FROM kv WHERE expires_at < ?", (time.time(),))
+        self.total_bytes = self._conn.execute("SELECT coalesce(sum(size), 0) FROM kv").fetchone()[0]
+        logger.info(f"💾 Дисковый кэш {path}: {self.total_bytes / 2 ** 20:.1f} МБ")
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """Значение и оставшийся TTL в секундах, или None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at, accessed_at FROM kv WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, expires_at, accessed_at = row
+            if expires_at <= now:
+                self._delete(key)
+                return None
+
+            if now - accessed_at > self.TOUCH_INTERVAL:
+                self._conn.execute("UPDATE kv SET accessed_at = ? WHERE key = ?", (now, key))
+
+        return value, expires_at - now
+
+    def set(self, key: str, value: str, ttl: int):
+        now = time.time()
+        size = len(key) + len(value.encode())
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM kv WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at, accessed_at, size) VALUES (?, ?, ?, ?, ?)",
+                (key, value, now + ttl, now, size)
+            )
+            self.total_bytes += size - (previous[0] if previous else 0)
+
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM kv")
+            self.total_bytes = 0
+
+    def _delete(self, key: str):
+        row = self._conn.execute("DELETE FROM kv WHERE key = ? RETURNING size", (key,)).fetchone()
+        if row:
+            self.total_bytes -= row[0]
+
+    def _evict(self):
+        """Удаляет просроченные, затем самые давно использованные записи до 90% лимита"""
+        self._conn.execute("DELETE FROM kv WHERE expires_at < ?", (time.time(),))
+        self.total_bytes = self._conn.execute("SELECT coalesce(sum(size), 0) FROM kv").fetchone()[0]
+
+        excess = self.total_bytes - self.max_bytes * 0.9
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM kv ORDER BY accessed_at"):
+            if excess <= 0:
+                break
+            victims.append((key,))
+            excess -= size
+
+        if victims:
+            self._conn.executemany("DELETE FROM kv WHERE key = ?", victims)
+            self.total_bytes = self._conn.execute("SELECT coalesce(sum(size), 0) FROM kv").fetchone()[0]
+            logger.info(f"💾 Дисковый кэш: вытеснено {len(victims)} записей")
+
+_disk_store = None
+# Хранилище не открылось: больше не пытаемся, но настройки не трогаем
+_disk_store_failed = False
+_disk_store_lock = threading.Lock()
+
+def get_disk_store() -> Optional[DiskStore]:
+    """Общее дисковое хранилище процесса, открывается при первом обращении (None, если отключено или недоступно)"""
+    global _disk_store, _disk_store_failed
+    if _disk_store is not None or _disk_store_failed or not config.DISK_STORE_PATH:
+        return _disk_store
+
+    with _disk_store_lock:
+        if _disk_store is None and not _disk_store_failed:
+            try:
+                directory = os.path.dirname(config.DISK_STORE_PATH)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                _disk_store = DiskStore(config.DISK_STORE_PATH, config.DISK_STORE_MAX_MB * 2 ** 20)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"⚠️ Дисковый кэш недоступен: {e}")
+                _disk_store_failed = True
+        return _disk_store
@@ -0,0 +1,54 @@
+import time
+from typing import Dict, Any, List
+
+from base import BaseLLMClient
+
+class FakeLLMClient(BaseLLMClient):
+    """Детерминированный локальный клиент для бенчмарков и тестов (без сети)"""
+
+    def __init__(self, latency: float = 0.0, name: str = "fake"):
+        self.latency = latency
+        self.model = name
+        self.calls = 0
+
+    def _wait(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """Возвращает последнее сообщение пользователя как ответ"""
+        self._wait()
+        return f"[{self.model}] {messages[-1]['content'][:200]}"
+
+    def analyze_preferences(self, text: str, categories: List[str]) -> Dict[str, Any]:
+        """Выбирает категории, слова которых встречаются в тексте"""
+        self._wait()
+        text_lower = text.lower()
+
+        found = []
+        for category in categories:
+            words = category.split(' ', 1)[-1].lower().split('/')
+            if any(word[:4] in text_lower for word in words):
+                found.append(category)
+
+        if not found:
+            found = categories[:2]
+
+        return {
+            "categories": found[:3],
+            "explanation": f"Определено локально: {', '.join(found[:3])}"
+        }
+
+    def generate_recommendations(self, parsed_data: List[Dict[str, Any]], categories: List[str]) -> str:
+        """Собирает рекомендации из заголовков страниц"""
+        self._wait()
+        if not parsed_data:
+            return "Не удалось получить информацию с сайтов."
+
+        lines = [f"Рекомендации по категориям: {', '.join(categories)}", ""]
+        for data in parsed_data:
+            lines.append(f"• {data['title']} — {data.get('content', '')[:120]}")
+        lines.append("")
+        lines.append(f"На основе анализа сайтов: {', '.join(d['url'] for d in parsed_data)}")
+        return "\n".join(lines)
@@ -0,0 +1,41 @@
+import re
+import hashlib
+from typing import Dict, Any, List
+
+WORD_RE = re.compile(r'\w+')
+BITS = 64
+
+def simhash(text: str, shingle: int = 3) -> int:
+    """64-битный SimHash по шинглам из слов: близкие тексты дают близкие отпечатки.
+
+    Числа сводятся к одному токену, чтобы смена дат и времени на странице не меняла отпечаток.
+    """
+    words = ['0' if word.isdigit() else word for word in WORD_RE.findall(text.lower())]
+    if len(words) < shingle:
+        shingles = [' '.join(words)] if words else []
+    else:
+        shingles = [' '.join(words[i:i + shingle]) for i in range(len(words) - shingle + 1)]
+
+    weights = [0] * BITS
+    for item in shingles:
+        value = int.from_bytes(hashlib.blake2b(item.encode(), digest_size=8).digest(), 'big')
+        for bit in range(BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    return sum(1 << bit for bit in range(BITS) if weights[bit] > 0)
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+def page_fingerprints(parsed_data: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Отпечатки страниц по URL (страницы из старого кэша без отпечатка считаются на месте)"""
+    return {
+        page["url"]: page.get("fingerprint") or simhash(page.get("content", ""))
+        for page in parsed_data
+    }
+
+def fingerprints_match(previous: Dict[str, int], current: Dict[str, int], max_distance: int) -> bool:
+    """Тот же набор страниц, и ни одна не изменилась сильнее порога (даты, баннеры не в счет)"""
+    if previous.keys() != current.keys():
+        return False
+    return all(hamming_distance(previous[url], current[url]) <= max_distance for url in current)
@@ -0,0 +1,147 @@
+import re
+import math
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+Coordinates = Tuple[float, float]
+
+# Офлайн-справочник городов: координаты центра и варианты написания в адресах
+GAZETTEER = {
+    "Москва": (55.7558, 37.6173, ("москва", "москвы", "москве", "moscow", "мск")),
+    "Санкт-Петербург": (59.9386, 30.3141, ("санкт-петербург", "петербург", "спб", "ленинград", "saint petersburg", "st. petersburg")),
+    "Казань": (55.7961, 49.1064, ("казань", "казани", "kazan")),
+    "Екатеринбург": (56.8389, 60.6057, ("екатеринбург", "yekaterinburg", "ekaterinburg")),
+    "Новосибирск": (55.0084, 82.9357, ("новосибирск", "novosibirsk")),
+    "Нижний Новгород": (56.3269, 44.0059, ("нижний новгород", "нижнем новгороде", "nizhny novgorod")),
+    "Самара": (53.1959, 50.1002, ("самара", "самаре", "samara")),
+    "Ростов-на-Дону": (47.2357, 39.7015, ("ростов-на-дону", "rostov-on-don")),
+    "Краснодар": (45.0355, 38.9753, ("краснодар", "krasnodar")),
+    "Сочи": (43.5855, 39.7231, ("сочи", "sochi")),
+    "Калининград": (54.7104, 20.4522, ("калининград", "kaliningrad")),
+    "Владивосток": (43.1155, 131.8855, ("владивосток", "vladivostok")),
+}
+
+_CITY_PATTERNS = [
+    (city, re.compile(r'(?<!\w)(?:' + '|'.join(re.escape(alias) for alias in aliases) + r')(?!\w)'))
+    for city, (_, _, aliases) in GAZETTEER.items()
+]
+
+# Пара "широта, долгота" в тексте страницы (например, из ссылки на карту или блока контактов)
+COORDINATES_RE = re.compile(r'(?<![\d.])(-?\d{1,2}\.\d{4,})\s*[,;]\s*(-?\d{1,3}\.\d{4,})(?![\d.])')
+
+def find_coordinates(text: str) -> Optional[Coordinates]:
+    match = COORDINATES_RE.search(text or "")
+    if not match:
+        return None
+    lat, lon = float(match.group(1)), float(match.group(2))
+    return (lat, lon) if -90 <= lat <= 90 and -180 <= lon <= 180 else None
+
+def find_city(text: str) -> Optional[str]:
+    text = (text or "").lower()
+    for city, pattern in _CITY_PATTERNS:
+        if pattern.search(text):
+            return city
+    return None
+
+def city_coordinates(city: str) -> Optional[Coordinates]:
+    if city not in GAZETTEER:
+        return None
+    lat, lon, _ = GAZETTEER[city]
+    return lat, lon
+
+def geocode(*texts: str) -> Optional[Coordinates]:
+    """Координаты из текста, иначе центр первого найденного города; без сети"""
+    for text in texts:
+        coordinates = find_coordinates(text)
+        if coordinates:
+            return coordinates
+    for text in texts:
+        city = find_city(text)
+        if city:
+            return city_coordinates(city)
+    return None
+
+def haversine_km(a: Coordinates, b: Coordinates) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+def geohash(lat: float, lon: float, precision: int = 6) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+def geohash_bounds(cell: str) -> Tuple[float, float, float, float]:
+    """(lat_min, lat_max, lon_min, lon_max) ячейки"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in cell:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+class GeoIndex:
+    """Сетка геохешей в памяти: ближайшие точки ищутся в блоке 3x3 ячеек, а не перебором"""
+
+    def __init__(self, precision: int = 3):
+        self.precision = precision
+        self.cells: Dict[str, List[Tuple[Coordinates, Any]]] = defaultdict(list)
+        self.size = 0
+
+    def add(self, coordinates: Coordinates, item: Any):
+        self.cells[geohash(*coordinates, self.precision)].append((coordinates, item))
+        self.size += 1
+
+    def nearest(self, coordinates: Coordinates, k: int) -> List[Tuple[float, Any]]:
+        """k ближайших (расстояние в км, объект); перебор всех точек только если блока не хватило"""
+        lat_min, lat_max, lon_min, lon_max = geohash_bounds(geohash(*coordinates, self.precision))
+        dlat, dlon = lat_max - lat_min, lon_max - lon_min
+        lat, lon = coordinates
+
+        block = {
+            geohash(lat + i * dlat, ((lon + j * dlon + 180) % 360) - 180, self.precision)
+            for i in (-1, 0, 1) for j in (-1, 0, 1)
+            if -90 <= lat + i * dlat <= 90
+        }
+        ranked = self._rank(coordinates, (entry for cell in block for entry in self.cells.get(cell, ())))
+
+        # Дальше этого радиуса могут быть точки вне блока, которые ближе найденных
+        covered_km = min(
+            (lat - (lat_min - dlat)) * 111.2,
+            ((lat_max + dlat) - lat) * 111.2,
+            min(lon - (lon_min - dlon), (lon_max + dlon) - lon) * 111.2 * math.cos(math.radians(min(abs(lat) + 2 * dlat, 90)))
+        )
+        if len(ranked) >= k and ranked[k - 1][0] <= covered_km:
+            return ranked[:k]
+
+        return self._rank(coordinates, (entry for entries in self.cells.values() for entry in entries))[:k]
+
+    @staticmethod
+    def _rank(coordinates: Coordinates, entries) -> List[Tuple[float, Any]]:
+        return sorted(
+            ((haversine_km(coordinates, point), item) for point, item in entries),
+            key=lambda ranked: ranked[0]
+        )
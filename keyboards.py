@@ -1,10 +1,14 @@
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from typing import List
+
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 
 def get_main_keyboard():
     """Основная клавиатура"""
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text="🎯 Рекомендации")],
+            [KeyboardButton(text="🔁 Мои интересы")],
+            [KeyboardButton(text="📍 Рядом со мной", request_location=True)],
             [KeyboardButton(text="📋 Категории")],
             [KeyboardButton(text="🆘 Помощь")]
         ],
@@ -18,9 +22,26 @@ def get_admin_keyboard():
         keyboard=[
             [KeyboardButton(text="📊 Статистика")],
             [KeyboardButton(text="🔗 Добавить ссылку")],
+            [KeyboardButton(text="📥 Импорт ссылок")],
             [KeyboardButton(text="🔄 Обновить кэш")],
             [KeyboardButton(text="◀️ Назад")]
         ],
         resize_keyboard=True
     )
-    return keyboard
\ No newline at end of file
+    return keyboard
+
+def get_categories_keyboard(categories: List[str], selected: List[int]):
+    """Инлайн-выбор нескольких категорий; в callback_data индекс, т.к. названия длиннее лимита Telegram"""
+    buttons = [
+        InlineKeyboardButton(
+            text=f"✅ {category}" if i in selected else category,
+            callback_data=f"cat:toggle:{i}"
+        )
+        for i, category in enumerate(categories)
+    ]
+    rows = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    rows.append([
+        InlineKeyboardButton(text=f"🔍 Найти ({len(selected)})", callback_data="cat:go"),
+        InlineKeyboardButton(text="✖️ Отмена", callback_data="cat:cancel")
+    ])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
\ No newline at end of file
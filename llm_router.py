@@ -0,0 +1,124 @@
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Dict, Any, List
+
+from base import BaseLLMClient
+from config import config
+from metrics import LLM_BACKEND_LATENCY, LLM_HEDGES
+
+logger = logging.getLogger(__name__)
+
+# Задача -> бэкенды по приоритету; следующий в списке получает дублирующий запрос
+DEFAULT_ROUTES = {
+    "analyze_preferences": ["cheap", "strong"],
+    "generate_recommendations": ["strong", "cheap"],
+    "chat_completion": ["strong", "cheap"],
+}
+
+class BackendStats:
+    """Скользящее окно задержек бэкенда"""
+
+    MIN_SAMPLES = 20
+
+    def __init__(self, window: int = 200):
+        self.latencies = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.latencies.append(seconds)
+
+    def p95(self) -> float:
+        """p95 задержки или порог по умолчанию, пока статистики мало"""
+        if len(self.latencies) < self.MIN_SAMPLES:
+            return config.LLM_HEDGE_AFTER
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+class LLMRouter(BaseLLMClient):
+    """Маршрутизация задач по бэкендам LLM с дублирующими запросами для хвостовых задержек"""
+
+    def __init__(self, backends: Dict[str, BaseLLMClient], routes: Dict[str, List[str]] = None, max_workers: int = 16):
+        self.backends = backends
+        self.routes = routes or DEFAULT_ROUTES
+        self.stats = {name: BackendStats() for name in backends}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+
+    def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        return self._call("chat_completion", messages, **kwargs)
+
+    def analyze_preferences(self, text: str, categories: List[str]) -> Dict[str, Any]:
+        return self._call("analyze_preferences", text, categories)
+
+    def generate_recommendations(self, parsed_data: List[Dict[str, Any]], categories: List[str]) -> str:
+        return self._call("generate_recommendations", parsed_data, categories)
+
+    def _backends_for(self, operation: str) -> List[str]:
+        names = [name for name in self.routes.get(operation, []) if name in self.backends]
+        return names or list(self.backends)
+
+    def _submit(self, name: str, operation: str, args, kwargs) -> Future:
+        backend = self.backends[name]
+
+        def timed_call():
+            started = time.perf_counter()
+            result = getattr(backend, operation)(*args, **kwargs)
+            elapsed = time.perf_counter() - started
+            self.stats[name].record(elapsed)
+            LLM_BACKEND_LATENCY.labels(name, operation).observe(elapsed)
+            return result
+
+        return self._executor.submit(timed_call)
+
+    def _call(self, operation: str, *args, **kwargs):
+        """Первый успешный ответ побеждает; дубль уходит после p95 основного бэкенда или при его ошибке"""
+        names = self._backends_for(operation)
+        primary, hedge = names[0], (names[1] if len(names) > 1 else None)
+
+        futures = {self._submit(primary, operation, args, kwargs): primary}
+        hedged = False
+
+        def launch_hedge(reason: str):
+            nonlocal hedged
+            hedged = True
+            logger.info(f"🔀 {operation}: дублирующий запрос в {hedge} ({reason})")
+            futures[self._submit(hedge, operation, args, kwargs)] = hedge
+
+        done, _ = wait(futures, timeout=self.stats[primary].p95())
+        if not done and hedge:
+            launch_hedge("основной бэкенд медленнее p95")
+
+        pending = set(futures)
+        last_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"⚠️ {operation}: ошибка бэкенда {futures[future]}: {e}")
+                    if hedge and not hedged:
+                        launch_hedge("ошибка основного бэкенда")
+                        pending = set(f for f in futures if not f.done())
+                    continue
+
+                if hedged:
+                    LLM_HEDGES.labels(operation, "hedge" if futures[future] == hedge else "primary").inc()
+                return result
+
+        raise last_error
+
+def build_default_router() -> LLMRouter:
+    """Роутер по настройкам: дешевая модель для анализа, сильная для генерации"""
+    if config.LLM_BACKEND == 'fake':
+        from fake_llm_client import FakeLLMClient
+
+        backends = {"cheap": FakeLLMClient(name="fake-cheap"), "strong": FakeLLMClient(name="fake-strong")}
+    else:
+        from mistral_client import MistralClient
+
+        backends = {"cheap": MistralClient(config.LLM_MODEL_CHEAP), "strong": MistralClient(config.LLM_MODEL)}
+
+    logger.info(f"🧠 LLM: {', '.join(f'{name}={client.model}' for name, client in backends.items())}")
+    return LLMRouter(backends)
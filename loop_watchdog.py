@@ -0,0 +1,120 @@
+import sys
+import time
+import asyncio
+import threading
+import traceback
+import logging
+from collections import deque
+from typing import Dict, Any, Callable, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from config import config
+from metrics import LOOP_LAG, LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+class HandlerContextMiddleware(BaseMiddleware):
+    """Запоминает, какой хендлер и для какого пользователя выполняет текущая задача"""
+
+    def __init__(self, watchdog: 'LoopWatchdog'):
+        self.watchdog = watchdog
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        task = asyncio.current_task()
+        handler_object = data.get("handler")
+        user = getattr(event, "from_user", None)
+
+        self.watchdog.task_context[task] = (
+            handler_object.callback.__name__ if handler_object else type(event).__name__,
+            user.id if user else None
+        )
+        try:
+            return await handler(event, data)
+        finally:
+            self.watchdog.task_context.pop(task, None)
+
+class LoopWatchdog:
+    """Измеряет задержку event loop и логирует стек кода, который его заблокировал"""
+
+    def __init__(self, threshold: float = None, interval: float = 0.1, window: int = 3000):
+        self.threshold = threshold or config.LOOP_STALL_THRESHOLD
+        self.interval = interval
+        self.lags = deque(maxlen=window)
+        self.task_context: Dict[asyncio.Task, tuple] = {}
+        self.stalls = 0
+
+        self._last_beat = time.monotonic()
+        self._reported_beat = None
+        self._stop = threading.Event()
+        self._heartbeat_task = None
+        self._thread = None
+
+    def start(self):
+        """Запускается из работающего event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"🐕 Watchdog event loop запущен, порог {self.threshold * 1000:.0f} мс")
+
+    async def stop(self):
+        self._stop.set()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+        if self._thread:
+            await asyncio.to_thread(self._thread.join)
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._last_beat = now
+            self.lags.append(lag)
+            LOOP_LAG.observe(lag)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval / 2):
+            last_beat = self._last_beat
+            blocked = time.monotonic() - last_beat - self.interval
+            if blocked > self.threshold and self._reported_beat != last_beat:
+                self._reported_beat = last_beat
+                self._report_stall(blocked)
+
+    def _report_stall(self, blocked: float):
+        """Снимает стек потока event loop прямо во время блокировки"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = ''.join(traceback.format_stack(frame)) if frame else "<стек недоступен>"
+
+        task = asyncio.tasks._current_tasks.get(self._loop)
+        handler_name, telegram_id = self.task_context.get(task, (None, None))
+        if handler_name is None and task is not None:
+            handler_name = task.get_coro().__qualname__
+
+        self.stalls += 1
+        LOOP_STALLS.labels(handler_name or "unknown").inc()
+        logger.warning(
+            f"🐢 Event loop заблокирован уже {blocked * 1000:.0f} мс: "
+            f"хендлер {handler_name or 'неизвестен'}, telegram_id {telegram_id or '-'}\n{stack}"
+        )
+
+    def percentiles(self) -> Dict[str, float]:
+        """p50/p95/p99 задержки event loop за последнее окно, мс"""
+        if not self.lags:
+            return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+
+        ordered = sorted(self.lags)
+        return {
+            name: ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+            for name, p in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+        }
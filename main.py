@@ -1,7 +1,11 @@
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.methods import DeleteWebhook
-from aiogram.types import Message
+from aiogram.types import Message, CallbackQuery, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
@@ -9,10 +13,17 @@ import asyncio
 import logging
 
 from config import config
-from services import LLMService, AdminService
-from keyboards import get_main_keyboard, get_admin_keyboard
+from services import LLMService, AdminService, SearchService, ReviewService, SourceImportService, PreferenceService
+from validators import sanitize_text, is_valid_rating, escape_markdown, markdown_bold
+from sender import MessageSender
+from metrics import STAGE_LATENCY, SEND_QUEUE_DEPTH, start_metrics_server
+from profiler import profile_for
+from loop_watchdog import LoopWatchdog, HandlerContextMiddleware
+from crawler import Crawler
+from users import UserDirectory
+from keyboards import get_main_keyboard, get_admin_keyboard, get_categories_keyboard
 from prompts import prompts
-from database import Session, User, Place, init_db
+from database import get_engine, dispose_engine
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,6 +32,15 @@ bot = Bot(token=config.BOT_TOKEN)
 dp = Dispatcher(storage=MemoryStorage())
 
 llm_service = LLMService()
+sender = MessageSender(bot)
+users = UserDirectory(llm_service.cache)
+SEND_QUEUE_DEPTH.set_function(lambda: sender.queue_depth)
+
+loop_watchdog = LoopWatchdog()
+dp.message.middleware(HandlerContextMiddleware(loop_watchdog))
+dp.callback_query.middleware(HandlerContextMiddleware(loop_watchdog))
+
+crawler_task = None
 
 class UserState(StatesGroup):
     waiting_preferences = State()
@@ -28,6 +48,7 @@ class UserState(StatesGroup):
 class AdminState(StatesGroup):
     waiting_url = State()
     waiting_category = State()
+    waiting_import = State()
 
 def split_long_message(text: str, max_length: int = 4000) -> list:
     """Разделяет длинное сообщение на части"""
@@ -56,15 +77,7 @@ def split_long_message(text: str, max_length: int = 4000) -> list:
 @dp.message(Command("start"))
 async def cmd_start(message: Message):
     """Начало работы"""
-    with Session() as session:
-        user = session.query(User).filter_by(telegram_id=str(message.from_user.id)).first()
-        if not user:
-            user = User(
-                telegram_id=str(message.from_user.id),
-                username=message.from_user.username
-            )
-            session.add(user)
-            session.commit()
+    users.register(str(message.from_user.id), message.from_user.username)
     
     await message.answer(
         prompts.MESSAGES["welcome"],
@@ -74,12 +87,163 @@ async def cmd_start(message: Message):
 
 @dp.message(F.text == "🎯 Рекомендации")
 async def ask_for_preferences(message: Message, state: FSMContext):
-    """Запрос предпочтений"""
+    """Запрос предпочтений: выбор категорий кнопками или описание текстом"""
+    categories = llm_service.get_available_categories()
+    
+    try:
+        saved = await asyncio.to_thread(PreferenceService.get_categories, str(message.from_user.id))
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось загрузить сохраненные категории: {e}")
+        saved = []
+    selected = [i for i, category in enumerate(categories) if category in saved]
+    
+    await state.set_state(UserState.waiting_preferences)
+    await state.update_data(selected_categories=selected)
     await message.answer(
         prompts.MESSAGES["ask_preferences"],
-        parse_mode="Markdown"
+        parse_mode="Markdown",
+        reply_markup=get_categories_keyboard(categories, selected)
     )
-    await state.set_state(UserState.waiting_preferences)
+
+@dp.callback_query(F.data.startswith("cat:toggle:"))
+async def toggle_category(callback: CallbackQuery, state: FSMContext):
+    """Отметка категории в инлайн-клавиатуре"""
+    categories = llm_service.get_available_categories()
+    index = int(callback.data.rsplit(":", 1)[1])
+    if index >= len(categories):
+        await callback.answer()
+        return
+    
+    data = await state.get_data()
+    selected = data.get("selected_categories", [])
+    selected = [i for i in selected if i != index] if index in selected else selected + [index]
+    await state.update_data(selected_categories=selected)
+    
+    await callback.message.edit_reply_markup(reply_markup=get_categories_keyboard(categories, selected))
+    await callback.answer()
+
+@dp.callback_query(F.data == "cat:go")
+async def recommend_selected_categories(callback: CallbackQuery, state: FSMContext):
+    """Рекомендации по выбранным категориям без анализа текста в LLM"""
+    categories = llm_service.get_available_categories()
+    data = await state.get_data()
+    chosen = [categories[i] for i in sorted(data.get("selected_categories", [])) if i < len(categories)]
+    
+    if not chosen:
+        await callback.answer(prompts.MESSAGES["no_selected_categories"], show_alert=True)
+        return
+    
+    await callback.answer()
+    await state.clear()
+    started = time.perf_counter()
+    
+    try:
+        processing_msg = await callback.message.edit_text(
+            f"🔍 *Ищу информацию по категориям:*\n{chr(10).join(['• ' + cat for cat in chosen])}",
+            parse_mode="Markdown"
+        )
+        await remember_categories(str(callback.from_user.id), chosen)
+        await send_recommendations(callback.message, chosen, processing_msg)
+        
+    except Exception as e:
+        logger.error(f"Ошибка рекомендаций по выбранным категориям: {e}")
+        await sender.send(callback.message.chat.id, prompts.MESSAGES["error"], parse_mode="Markdown")
+    
+    STAGE_LATENCY.labels('pick_categories').observe(time.perf_counter() - started)
+
+@dp.callback_query(F.data == "cat:cancel")
+async def cancel_category_picker(callback: CallbackQuery, state: FSMContext):
+    """Закрытие инлайн-клавиатуры выбора"""
+    await state.clear()
+    await callback.message.delete()
+    await callback.answer()
+
+async def remember_categories(telegram_id: str, categories: list):
+    """Сохраняет категории для повтора; ошибка БД не должна срывать уже начатые рекомендации"""
+    try:
+        await users.ensure_saved(telegram_id)
+        await asyncio.to_thread(PreferenceService.save_categories, telegram_id, categories)
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось сохранить категории: {e}")
+
+async def send_recommendations(message: Message, categories: list, processing_msg: Message = None):
+    """Получает рекомендации по категориям (рядом с сохраненной геопозицией) и отправляет их через очередь"""
+    try:
+        location = await asyncio.to_thread(PreferenceService.get_location, str(message.chat.id))
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось загрузить геопозицию: {e}")
+        location = None
+    
+    recommendations = await llm_service.get_recommendations(categories, location)
+    
+    if processing_msg:
+        await processing_msg.delete()
+    
+    if recommendations:
+        full_response = f"🎯 *Вот что я нашел:*\n\n{recommendations}"
+        message_parts = split_long_message(full_response)
+    else:
+        message_parts = ["😔 *Не удалось найти подходящие места.*"]
+    
+    pending = [sender.enqueue(message.chat.id, part, parse_mode="Markdown") for part in message_parts]
+    pending.append(sender.enqueue(
+        message.chat.id,
+        "🔄 *Хотите уточнить критерии?*\nПросто нажмите '🎯 Рекомендации'",
+        parse_mode="Markdown",
+        reply_markup=get_main_keyboard()
+    ))
+    await asyncio.gather(*pending)
+
+@dp.message(F.text == "🔁 Мои интересы")
+async def repeat_last_preferences(message: Message, state: FSMContext):
+    """Повтор рекомендаций по сохраненным категориям без анализа текста"""
+    await state.clear()
+    
+    try:
+        categories = await asyncio.to_thread(PreferenceService.get_categories, str(message.from_user.id))
+        categories = [category for category in categories if category in llm_service.url_database]
+        
+        if not categories:
+            await message.answer(prompts.MESSAGES["no_saved_preferences"], parse_mode="Markdown")
+            return
+        
+        processing_msg = await message.answer(
+            f"🔁 *Ищу по вашим интересам:*\n{chr(10).join(['• ' + cat for cat in categories])}",
+            parse_mode="Markdown"
+        )
+        await send_recommendations(message, categories, processing_msg)
+        
+    except Exception as e:
+        logger.error(f"Ошибка повтора рекомендаций: {e}")
+        await sender.send(message.chat.id, prompts.MESSAGES["error"], parse_mode="Markdown")
+
+@dp.message(F.location)
+async def save_location(message: Message, state: FSMContext):
+    """Геопозиция пользователя: дальше источники выбираются ближайшие к ней"""
+    await state.clear()
+    telegram_id = str(message.from_user.id)
+    
+    try:
+        await users.ensure_saved(telegram_id)
+        await asyncio.to_thread(
+            PreferenceService.save_location, telegram_id, message.location.latitude, message.location.longitude
+        )
+        categories = await asyncio.to_thread(PreferenceService.get_categories, telegram_id)
+        categories = [category for category in categories if category in llm_service.url_database]
+        
+        if not categories:
+            await message.answer(prompts.MESSAGES["location_saved"], parse_mode="Markdown")
+            return
+        
+        processing_msg = await message.answer(
+            f"📍 *Ищу рядом с вами:*\n{chr(10).join(['• ' + cat for cat in categories])}",
+            parse_mode="Markdown"
+        )
+        await send_recommendations(message, categories, processing_msg)
+        
+    except Exception as e:
+        logger.error(f"Ошибка рекомендаций по геопозиции: {e}")
+        await sender.send(message.chat.id, prompts.MESSAGES["error"], parse_mode="Markdown")
 
 @dp.message(F.text == "📋 Категории")
 async def show_categories_button(message: Message):
@@ -91,7 +255,7 @@ async def show_categories_button(message: Message):
         urls_count = len(config.URL_DATABASE.get(category, []))
         categories_text += f"• {category} ({urls_count} источников)\n"
     
-    categories_text += "\n*Выберите '🎯 Рекомендации' и опишите, что вас интересует!*"
+    categories_text += "\n*Нажмите '🎯 Рекомендации' и отметьте нужные категории или опишите, что вас интересует!*"
     
     await message.answer(categories_text, parse_mode="Markdown")
 
@@ -102,10 +266,13 @@ async def show_help_button(message: Message):
 
 *Как получить рекомендации:*
 1. Нажмите "🎯 Рекомендации"
-2. Опишите свои предпочтения
+2. Отметьте категории кнопками или опишите свои предпочтения
 3. Бот проанализирует сайты
 4. Получите рекомендации
 
+Кнопка "🔁 Мои интересы" повторит поиск по вашему прошлому запросу.
+Кнопка "📍 Рядом со мной" отправит геопозицию - источники будут подбираться ближайшие к вам.
+
 *Примеры запросов:*
 • "Хочу сходить в музей"
 • "Ищу хороший ресторан"
@@ -116,6 +283,8 @@ async def show_help_button(message: Message):
 /start - начать диалог
 /help - помощь  
 /categories - список категорий
+/search <запрос> - быстрый поиск мест
+/review <ID места> <1-5> [текст] - оставить отзыв
 /stats - статистика
 """
     await message.answer(help_text, parse_mode="Markdown")
@@ -123,10 +292,11 @@ async def show_help_button(message: Message):
 @dp.message(UserState.waiting_preferences)
 async def process_preferences(message: Message, state: FSMContext):
     """Обработка предпочтений"""
+    started = time.perf_counter()
     processing_msg = await message.answer(prompts.MESSAGES["processing"], parse_mode="Markdown")
     
     try:
-        analysis = llm_service.analyze_preferences(message.text)
+        analysis = await asyncio.to_thread(llm_service.analyze_preferences, message.text)
         categories = analysis.get("categories", [])
         
         if not categories:
@@ -137,7 +307,8 @@ async def process_preferences(message: Message, state: FSMContext):
         
         explanation_text = analysis.get('explanation', '')
         
-        await message.answer(
+        await sender.send(
+            message.chat.id,
             f"✅ *Я понял, что вам интересно:*\n\n"
             f"{explanation_text}\n\n"
             f"🔍 *Ищу информацию по категориям:*\n"
@@ -145,29 +316,15 @@ async def process_preferences(message: Message, state: FSMContext):
             parse_mode="Markdown"
         )
         
-        recommendations = await llm_service.get_recommendations(categories)
-        
-        await processing_msg.delete()
-        
-        if recommendations:
-            full_response = f"🎯 *Вот что я нашел:*\n\n{recommendations}"
-            message_parts = split_long_message(full_response)
-            
-            for part in message_parts:
-                await message.answer(part, parse_mode="Markdown")
-        else:
-            await message.answer("😔 *Не удалось найти подходящие места.*", parse_mode="Markdown")
+        await remember_categories(str(message.from_user.id), categories)
         
-        await message.answer(
-            "🔄 *Хотите уточнить критерии?*\nПросто нажмите '🎯 Рекомендации'",
-            parse_mode="Markdown",
-            reply_markup=get_main_keyboard()
-        )
+        await send_recommendations(message, categories, processing_msg)
         
     except Exception as e:
         logger.error(f"Ошибка обработки: {e}")
-        await message.answer(prompts.MESSAGES["error"], parse_mode="Markdown")
+        await sender.send(message.chat.id, prompts.MESSAGES["error"], parse_mode="Markdown")
     
+    STAGE_LATENCY.labels('process_preferences').observe(time.perf_counter() - started)
     await state.clear()
 
 @dp.message(Command("help"))
@@ -180,14 +337,106 @@ async def cmd_categories(message: Message):
     """Команда списка категорий"""
     await show_categories_button(message)
 
+def format_search_results(query: str, results: list) -> str:
+    """Форматирует выдачу поиска по местам"""
+    # Названия, описания и ссылки взяты с сайтов: без экранирования _ или * ломают разметку всего ответа
+    text = markdown_bold(f"🔎 Найдено по запросу «{query}»:") + "\n"
+    
+    for place in results:
+        text += f"\n{markdown_bold(place['name'])} (ID {place['id']})"
+        if place['category']:
+            text += f" — {escape_markdown(place['category'])}"
+        if place['review_count']:
+            text += f"\n⭐ {place['rating']:.1f} ({place['review_count']} отзывов)"
+        if place['address']:
+            text += f"\n📍 {escape_markdown(place['address'])}"
+        if place['description']:
+            text += f"\n{escape_markdown(sanitize_text(place['description'], 200))}"
+        if place['source_url']:
+            text += f"\n🔗 {escape_markdown(place['source_url'])}"
+        text += "\n"
+    
+    return text
+
+@dp.message(Command("search"))
+async def cmd_search(message: Message, command: CommandObject):
+    """Поиск мест по индексу; LLM только если уверенного совпадения нет"""
+    query = sanitize_text(command.args or "", 200)
+    
+    if not query:
+        await message.answer(prompts.MESSAGES["search_usage"], parse_mode="Markdown")
+        return
+    
+    try:
+        results = await asyncio.to_thread(SearchService.search, query)
+        
+        if SearchService.is_confident(results):
+            await sender.send_many(
+                message.chat.id,
+                split_long_message(format_search_results(query, results)),
+                parse_mode="Markdown"
+            )
+            return
+        
+        processing_msg = await message.answer(prompts.MESSAGES["processing"], parse_mode="Markdown")
+        
+        analysis = await asyncio.to_thread(llm_service.analyze_preferences, query)
+        categories = analysis.get("categories", [])
+        recommendations = await llm_service.get_recommendations(categories) if categories else ""
+        
+        await processing_msg.delete()
+        
+        if recommendations:
+            message_parts = split_long_message(f"🎯 *Вот что я нашел:*\n\n{recommendations}")
+        else:
+            message_parts = ["😔 *Не удалось найти подходящие места.*"]
+        
+        await sender.send_many(message.chat.id, message_parts, parse_mode="Markdown")
+        
+    except Exception as e:
+        logger.error(f"Ошибка поиска: {e}")
+        await sender.send(message.chat.id, prompts.MESSAGES["error"], parse_mode="Markdown")
+
+@dp.message(Command("review"))
+async def cmd_review(message: Message, command: CommandObject):
+    """Отзыв о месте: /review <ID места> <оценка 1-5> [текст]"""
+    args = (command.args or "").split(maxsplit=2)
+    
+    if len(args) < 2 or not args[0].isdigit() or not is_valid_rating(args[1]):
+        await message.answer(prompts.MESSAGES["review_usage"], parse_mode="Markdown")
+        return
+    
+    place_id, rating = int(args[0]), int(args[1])
+    review_text = sanitize_text(args[2]) if len(args) > 2 else ""
+    
+    try:
+        await users.ensure_saved(str(message.from_user.id))
+        result = await asyncio.to_thread(
+            ReviewService.submit_review, str(message.from_user.id), place_id, rating, review_text
+        )
+    except Exception as e:
+        logger.error(f"Ошибка сохранения отзыва: {e}")
+        await message.answer(prompts.MESSAGES["error"], parse_mode="Markdown")
+        return
+    
+    if not result:
+        await message.answer("❌ Место не найдено. Если вы здесь впервые, нажмите /start.")
+        return
+    
+    llm_service.invalidate_source_ranking()
+    await message.answer(
+        (f"✅ Ваш отзыв о {markdown_bold(result['name'])} обновлен.\n" if result['updated'] else
+         f"✅ Спасибо за отзыв о {markdown_bold(result['name'])}!\n") +
+        f"⭐ Рейтинг: {result['rating']:.1f} ({result['review_count']} отзывов)",
+        parse_mode="Markdown"
+    )
+
 @dp.message(Command("admin"))
 async def admin_panel(message: Message, state: FSMContext):
     """Панель администратора"""
-    with Session() as session:
-        user = session.query(User).filter_by(telegram_id=str(message.from_user.id)).first()
-        if not user or user.role != 'admin':
-            await message.answer("⛔ У вас нет прав администратора.", reply_markup=get_main_keyboard())
-            return
+    if not await users.is_admin(str(message.from_user.id)):
+        await message.answer("⛔ У вас нет прав администратора.", reply_markup=get_main_keyboard())
+        return
     
     admin_text = """*⚙️ Панель администратора*
 
@@ -205,42 +454,100 @@ async def admin_panel(message: Message, state: FSMContext):
     await message.answer(admin_text, parse_mode="Markdown", reply_markup=get_admin_keyboard())
     await state.clear()
 
+@dp.message(Command("profile"))
+async def cmd_profile(message: Message, command: CommandObject):
+    """Профилирование работающего бота: /profile [секунд]"""
+    if not await users.is_admin(str(message.from_user.id)):
+        await message.answer("⛔ У вас нет прав администратора.", reply_markup=get_main_keyboard())
+        return
+    
+    arg = (command.args or "").strip()
+    seconds = min(int(arg), 120) if arg.isdigit() and int(arg) > 0 else 10
+    
+    await message.answer(f"🔬 Профилирую {seconds} с...")
+    
+    try:
+        profiler = await profile_for(seconds)
+    except RuntimeError as e:
+        await message.answer(f"⚠️ {e}")
+        return
+    
+    await message.answer(profiler.report())
+    await message.answer_document(
+        BufferedInputFile(profiler.flamegraph_svg().encode(), filename="flamegraph.svg"),
+        caption="🔥 Флеймграф (откройте в браузере)"
+    )
+    await message.answer_document(
+        BufferedInputFile(profiler.folded().encode(), filename="profile.folded"),
+        caption="Свернутые стеки для speedscope / flamegraph.pl"
+    )
+
 @dp.message(F.text == "📊 Статистика")
 async def show_admin_stats(message: Message):
     """Статистика для админа"""
-    with Session() as session:
-        user = session.query(User).filter_by(telegram_id=str(message.from_user.id)).first()
-        if not user or user.role != 'admin':
-            return
+    if not await users.is_admin(str(message.from_user.id)):
+        return
     
     stats = AdminService.get_url_stats()
-    total_users = session.query(User).count()
-    total_places = session.query(Place).count()
+    counters = await asyncio.to_thread(AdminService.get_detailed_stats)
     
     stats_text = f"""*📊 Детальная статистика:*
 
 *Пользователи:*
-• Всего: {total_users}
-• Админы: {session.query(User).filter_by(role='admin').count()}
+• Всего: {counters['users']}
+• Админы: {counters['admins']}
 
 *Места:*
-• Всего: {total_places}
-• Активных: {session.query(Place).filter_by(is_active=True).count()}
+• Всего: {counters['places']}
+• Активных: {counters['active_places']}
+
+*Отзывы:*
+• Всего: {counters['reviews']}
+• Проверено: {counters['moderated_reviews']}
 
 *Источники по категориям:*"""
     
     for category, count in stats.items():
         stats_text += f"\n• {category}: {count}"
     
+    usage = await asyncio.to_thread(llm_service.usage.summary, 7)
+    if usage["available"]:
+        stats_text += f"""
+
+*Использование за {usage['days']} дн.:*
+• Запросов рекомендаций: {usage['rec_requests']}
+• Из кэша: {usage['cache_hit_rate']:.0%} (продлено без LLM: {usage['rec_reused']})"""
+        for category, count in usage["categories"][:5]:
+            stats_text += f"\n• {category}: {count}"
+        stats_text += "\n\n*Вызовы LLM по дням:*\n" + "\n".join(
+            f"• {day}: {calls}" for day, calls in usage["llm_calls_by_day"]
+        )
+    else:
+        stats_text += "\n\n*Использование:* нет данных (Redis не подключен)"
+    
+    send_stats = sender.get_stats()
+    stats_text += f"""
+
+*Очередь отправки:*
+• В очереди: {send_stats['queue_depth']}
+• Отправлено: {send_stats['sent']} (склеено: {send_stats['merged']})
+• Повторов после 429: {send_stats['retries']}
+• Ошибок: {send_stats['failed']}"""
+    
+    lag = loop_watchdog.percentiles()
+    stats_text += f"""
+
+*Event loop:*
+• Задержка p50/p95/p99: {lag['p50']:.1f} / {lag['p95']:.1f} / {lag['p99']:.1f} мс
+• Блокировок дольше {loop_watchdog.threshold * 1000:.0f} мс: {loop_watchdog.stalls}"""
+    
     await message.answer(stats_text, parse_mode="Markdown")
 
 @dp.message(F.text == "🔗 Добавить ссылку")
 async def add_url_start(message: Message, state: FSMContext):
     """Начало добавления ссылки"""
-    with Session() as session:
-        user = session.query(User).filter_by(telegram_id=str(message.from_user.id)).first()
-        if not user or user.role != 'admin':
-            return
+    if not await users.is_admin(str(message.from_user.id)):
+        return
     
     categories = list(config.URL_DATABASE.keys())
     categories_text = "\n".join([f"{i+1}. {cat}" for i, cat in enumerate(categories)])
@@ -293,20 +600,69 @@ async def add_url_finish(message: Message, state: FSMContext):
     await state.clear()
     await admin_panel(message, state)
 
+@dp.message(F.text == "📥 Импорт ссылок")
+async def import_urls_start(message: Message, state: FSMContext):
+    """Начало массового импорта ссылок"""
+    if not await users.is_admin(str(message.from_user.id)):
+        return
+    
+    await message.answer(prompts.MESSAGES["import_usage"], parse_mode="Markdown")
+    await state.set_state(AdminState.waiting_import)
+
+@dp.message(AdminState.waiting_import, F.document)
+async def import_urls_finish(message: Message, state: FSMContext):
+    """Импорт ссылок из CSV/JSON-документа"""
+    document = message.document
+    
+    if document.file_size and document.file_size > 1024 * 1024:
+        await message.answer("❌ Файл больше 1 МБ")
+        return
+    
+    await state.clear()
+    progress_msg = await message.answer("⏳ Проверяю ссылки...")
+    
+    try:
+        buffer = await bot.download(document)
+        rows = SourceImportService.parse_rows(buffer.read(), document.file_name or "")
+        report = await SourceImportService.import_sources(rows)
+    except Exception as e:
+        logger.error(f"Ошибка импорта ссылок: {e}")
+        await progress_msg.edit_text("❌ Не удалось прочитать файл. Нужен CSV или JSON со столбцами category, url.")
+        return
+    
+    report_text = (
+        f"📥 Импорт завершен за {report['elapsed']:.1f} с\n\n"
+        f"• Строк: {report['total']}\n"
+        f"• Добавлено: {report['added']}\n"
+        f"• Дубликатов: {report['duplicates']}\n"
+        f"• Некорректных: {report['invalid']}\n"
+        f"• Недоступных: {report['unreachable']}\n"
+        f"• Без текста: {report['unparsed']}"
+    )
+    if report['errors']:
+        report_text += "\n\nПервые ошибки:\n" + "\n".join(report['errors'][:10])
+    
+    await progress_msg.edit_text(report_text)
+
+@dp.message(AdminState.waiting_import)
+async def import_urls_wrong_input(message: Message, state: FSMContext):
+    """Вместо файла пришел текст"""
+    if message.text == "◀️ Назад":
+        await back_to_main(message, state)
+        return
+    await message.answer("📎 Отправьте CSV или JSON файлом или нажмите '◀️ Назад'.")
+
 @dp.message(F.text == "🔄 Обновить кэш")
 async def clear_cache(message: Message):
     """Очистка кэша Redis"""
-    with Session() as session:
-        user = session.query(User).filter_by(telegram_id=str(message.from_user.id)).first()
-        if not user or user.role != 'admin':
-            return
+    if not await users.is_admin(str(message.from_user.id)):
+        return
     
     from services import CacheService
     cache = CacheService()
     
-    if cache.redis:
-        cache.redis.flushall()
-        await message.answer("✅ Кэш Redis очищен")
+    if cache.clear_all():
+        await message.answer("✅ Кэш очищен (Redis и диск)" if cache.redis else "✅ Дисковый кэш очищен, Redis не подключен")
     else:
         await message.answer("⚠️ Redis не подключен")
 
@@ -353,16 +709,61 @@ async def handle_other_messages(message: Message):
             reply_markup=get_main_keyboard()
         )
 
+startup_timings = {}
+
+async def _warmup():
+    """Фоновый прогрев Redis, пула БД и SDK LLM после старта; заодно подгружает импортированные источники"""
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(get_engine)
+        await asyncio.to_thread(SourceImportService.restore_sources)
+        await asyncio.to_thread(llm_service.warmup)
+        logger.info(f"🔥 Прогрев завершен за {(time.perf_counter() - started) * 1000:.0f} мс")
+    except Exception as e:
+        logger.warning(f"⚠️ Ошибка прогрева: {e}")
+
+@dp.startup()
+async def on_startup():
+    """Хук запуска: отчет о времени старта и фоновый прогрев"""
+    startup_timings['ready'] = time.perf_counter() - _IMPORT_STARTED
+    
+    start_metrics_server()
+    loop_watchdog.start()
+    
+    print("⏱️  Время запуска:")
+    for stage, seconds in startup_timings.items():
+        print(f"   • {stage}: {seconds * 1000:.0f} мс")
+    
+    asyncio.create_task(_warmup())
+    
+    users.start()
+    
+    if config.CRAWL_ENABLED:
+        global crawler_task
+        crawler_task = asyncio.create_task(Crawler().run_forever())
+
+@dp.shutdown()
+async def on_shutdown():
+    """Хук остановки: досылаем очередь и закрываем соединения"""
+    if crawler_task:
+        crawler_task.cancel()
+    await sender.close()
+    await users.close()
+    await loop_watchdog.stop()
+    dispose_engine()
+
 async def main():
     """Основная функция запуска бота"""
+    startup_timings['import'] = time.perf_counter() - _IMPORT_STARTED
+    
+    started = time.perf_counter()
     await bot(DeleteWebhook(drop_pending_updates=True))
+    startup_timings['delete_webhook'] = time.perf_counter() - started
     
     print("=" * 50)
     print("🤖 *Бот рекомендаций мест отдыха*")
     print("=" * 50)
     
-    init_db()
-    
     stats = AdminService.get_url_stats()
     total_categories = len(stats)
     total_sites = sum(stats.values())
@@ -0,0 +1,120 @@
+import logging
+from urllib.parse import urlparse
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+STAGE_LATENCY = Histogram(
+    'bot_stage_seconds',
+    'Длительность этапов обработки запроса',
+    ['stage'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+FETCH_LATENCY = Histogram(
+    'bot_fetch_seconds',
+    'Длительность загрузки страницы по хостам',
+    ['host'],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10)
+)
+
+FETCH_TOTAL = Counter(
+    'bot_fetch_total',
+    'Загрузки страниц по хостам и статусам',
+    ['host', 'status']
+)
+
+CACHE_REQUESTS = Counter(
+    'bot_cache_requests_total',
+    'Обращения к кэшу по префиксу ключа',
+    ['prefix', 'result']
+)
+
+CACHE_STORED_BYTES = Counter(
+    'bot_cache_stored_bytes_total',
+    'Байты, записанные в кэш, по префиксу ключа и кодеку',
+    ['prefix', 'codec']
+)
+
+CACHE_BYTES_SAVED = Counter(
+    'bot_cache_bytes_saved_total',
+    'Экономия байтов кэша против прежнего формата (json.dumps без сжатия)',
+    ['prefix']
+)
+
+REC_GENERATIONS = Counter(
+    'bot_rec_generations_total',
+    'Обновления рекомендаций: сгенерировано LLM, продлено по отпечатку источников или ошибка LLM',
+    ['result']
+)
+
+LLM_TOKENS = Counter(
+    'bot_llm_tokens_total',
+    'Токены LLM',
+    ['operation', 'kind']
+)
+
+LLM_ERRORS = Counter(
+    'bot_llm_errors_total',
+    'Ошибки запросов к LLM',
+    ['operation']
+)
+
+LLM_BACKEND_LATENCY = Histogram(
+    'bot_llm_backend_seconds',
+    'Длительность запросов к бэкендам LLM',
+    ['backend', 'operation'],
+    buckets=(0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30)
+)
+
+LLM_HEDGES = Counter(
+    'bot_llm_hedged_requests_total',
+    'Дублирующие запросы к LLM и какой из ответов пришел первым',
+    ['operation', 'winner']
+)
+
+SEND_QUEUE_DEPTH = Gauge(
+    'bot_send_queue_depth',
+    'Сообщения в очереди отправки Telegram'
+)
+
+LOOP_LAG = Histogram(
+    'bot_event_loop_lag_seconds',
+    'Задержка event loop относительно ожидаемого времени пробуждения',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+LOOP_STALLS = Counter(
+    'bot_event_loop_stalls_total',
+    'Блокировки event loop дольше порога по хендлерам',
+    ['handler']
+)
+
+def record_llm_usage(operation: str, response):
+    """Учитывает токены из ответа LLM, если провайдер их вернул"""
+    usage = getattr(response, 'usage', None)
+    if usage:
+        LLM_TOKENS.labels(operation, 'prompt').inc(usage.prompt_tokens or 0)
+        LLM_TOKENS.labels(operation, 'completion').inc(usage.completion_tokens or 0)
+
+# Хосты встроенных источников; импортированные и найденные обходом сайты идут в один ряд 'other'
+KNOWN_HOSTS = frozenset(urlparse(url).netloc for urls in config.URL_DATABASE.values() for url in urls)
+
+def host_label(url: str) -> str:
+    """Метка хоста с ограниченным числом значений"""
+    host = urlparse(url).netloc
+    return host if host in KNOWN_HOSTS else 'other'
+
+def start_metrics_server():
+    """Запускает локальный HTTP-эндпоинт /metrics в формате Prometheus"""
+    if not config.METRICS_PORT:
+        return
+    try:
+        start_http_server(config.METRICS_PORT, addr=config.METRICS_HOST)
+    except OSError as e:
+        # Порт занят (второй процесс, перекрывающийся деплой): бот работает и без /metrics
+        logger.warning(f"⚠️ Метрики не запущены на порту {config.METRICS_PORT}: {e}")
+        return
+    logger.info(f"📈 Метрики: http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
@@ -1,32 +1,40 @@
 import json
 import logging
-from mistralai import Mistral
 from typing import Dict, Any, List
 
 from base import BaseLLMClient
 from config import config
 from prompts import prompts
+from metrics import LLM_ERRORS, record_llm_usage
 
 logger = logging.getLogger(__name__)
 
 class MistralClient(BaseLLMClient):
     """Реализация для Mistral AI"""
     
-    def __init__(self):
+    def __init__(self, model: str = None):
+        from mistralai import Mistral
+        
         self.client = Mistral(api_key=config.MISTRAL_API_KEY)
-        self.model = config.LLM_MODEL
+        self.model = model or config.LLM_MODEL
     
     def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> str:
         """Получение ответа от Mistral"""
+        return self._complete('chat_completion', messages, **kwargs)
+    
+    def _complete(self, operation: str, messages: List[Dict[str, str]], **kwargs) -> str:
+        """Запрос к API; токены и ошибки учитываются здесь один раз, под именем операции"""
         try:
             response = self.client.chat.complete(
                 model=self.model,
                 messages=messages,
                 **kwargs
             )
+            record_llm_usage(operation, response)
             return response.choices[0].message.content
         except Exception as e:
-            logger.error(f"Ошибка Mistral API: {e}")
+            LLM_ERRORS.labels(operation).inc()
+            logger.error(f"Ошибка Mistral API ({operation}): {e}")
             raise
     
     def analyze_preferences(self, text: str, categories: List[str]) -> Dict[str, Any]:
@@ -36,34 +44,33 @@ class MistralClient(BaseLLMClient):
             categories=', '.join(categories)
         )
         
+        response_text = self._complete(
+            'analyze_preferences',
+            messages=[
+                {"role": "system", "content": "Ты всегда возвращаешь только валидный JSON."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.1
+        )
+        response_text = (response_text or '').strip()
+        
+        if response_text.startswith('```'):
+            lines = response_text.split('\n')
+            response_text = '\n'.join(lines[1:-1]) if len(lines) > 2 else lines[0]
+        
         try:
-            response = self.client.chat.complete(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "Ты всегда возвращаешь только валидный JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1
-            )
-            
-            response_text = response.choices[0].message.content.strip()
-            
-            if response_text.startswith('```'):
-                lines = response_text.split('\n')
-                response_text = '\n'.join(lines[1:-1]) if len(lines) > 2 else lines[0]
-            
             result = json.loads(response_text)
-            
-            if "categories" not in result:
-                result["categories"] = []
-            if "explanation" not in result:
-                result["explanation"] = "Определено автоматически"
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"Ошибка анализа предпочтений: {e}")
-            return self._fallback_category_detection(text, categories)
+        except ValueError as e:
+            LLM_ERRORS.labels('analyze_preferences').inc()
+            logger.error(f"Ошибка анализа предпочтений: ответ не JSON ({e})")
+            raise
+        
+        if "categories" not in result:
+            result["categories"] = []
+        if "explanation" not in result:
+            result["explanation"] = "Определено автоматически"
+        
+        return result
     
     def generate_recommendations(self, parsed_data: List[Dict[str, Any]], categories: List[str]) -> str:
         """Генерация рекомендаций на основе распарсенных данных"""
@@ -84,45 +91,42 @@ class MistralClient(BaseLLMClient):
             sites_info='\n---\n'.join(sites_info)
         )
         
-        try:
-            return self.chat_completion(
-                messages=[
-                    {"role": "system", "content": "Ты даешь рекомендации по местам отдыха."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=1500
-            )
-        except Exception as e:
-            logger.error(f"Ошибка генерации рекомендаций: {e}")
-            return "Не удалось сформировать рекомендации."
+        return self._complete(
+            'generate_recommendations',
+            messages=[
+                {"role": "system", "content": "Ты даешь рекомендации по местам отдыха."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=1500
+        )
+
+def fallback_category_detection(text: str, available_categories: List[str]) -> Dict[str, Any]:
+    """Резервное определение категорий по ключевым словам, когда ни один бэкенд LLM не ответил"""
+    text_lower = text.lower()
+    categories = []
     
-    def _fallback_category_detection(self, text: str, available_categories: List[str]) -> Dict[str, Any]:
-        """Резервный метод определения категорий"""
-        text_lower = text.lower()
-        categories = []
-        
-        keyword_mapping = {
-            "🏛️ Музеи": ['музей', 'истори', 'экспоз'],
-            "🎨 Искусство/Выставки": ['искусств', 'выставк', 'галере', 'арт'],
-            "🍽️ Рестораны/Кафе": ['ресторан', 'кафе', 'еда', 'кухн'],
-            "☕ Кофейни": ['кофе', 'кофейн'],
-            "🏞️ Парки/Прогулки": ['парк', 'прогул', 'сквер'],
-            "🎭 Театры/Концерты": ['театр', 'концерт', 'спектакл'],
-            "🎳 Развлечения": ['кино', 'боулинг', 'квест'],
-            "🛍️ Шоппинг": ['магазин', 'шоппинг', 'торгов'],
-            "🎪 События/Фестивали": ['фестивал', 'событи', 'мероприят'],
-            "🍻 Бары/Пабы": ['бар', 'паб', 'пиво', 'коктейл']
-        }
-        
-        for category, keywords in keyword_mapping.items():
-            if category in available_categories and any(k in text_lower for k in keywords):
-                categories.append(category)
-        
-        if not categories:
-            categories = available_categories[:2] if available_categories else []
-        
-        return {
-            "categories": categories[:3],
-            "explanation": f"Определено по ключевым словам: {', '.join(categories)}"
-        }
\ No newline at end of file
+    keyword_mapping = {
+        "🏛️ Музеи": ['музей', 'истори', 'экспоз'],
+        "🎨 Искусство/Выставки": ['искусств', 'выставк', 'галере', 'арт'],
+        "🍽️ Рестораны/Кафе": ['ресторан', 'кафе', 'еда', 'кухн'],
+        "☕ Кофейни": ['кофе', 'кофейн'],
+        "🏞️ Парки/Прогулки": ['парк', 'прогул', 'сквер'],
+        "🎭 Театры/Концерты": ['театр', 'концерт', 'спектакл'],
+        "🎳 Развлечения": ['кино', 'боулинг', 'квест'],
+        "🛍️ Шоппинг": ['магазин', 'шоппинг', 'торгов'],
+        "🎪 События/Фестивали": ['фестивал', 'событи', 'мероприят'],
+        "🍻 Бары/Пабы": ['бар', 'паб', 'пиво', 'коктейл']
+    }
+    
+    for category, keywords in keyword_mapping.items():
+        if category in available_categories and any(k in text_lower for k in keywords):
+            categories.append(category)
+    
+    if not categories:
+        categories = available_categories[:2] if available_categories else []
+    
+    return {
+        "categories": categories[:3],
+        "explanation": f"Определено по ключевым словам: {', '.join(categories)}"
+    }
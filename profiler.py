@@ -0,0 +1,167 @@
+import os
+import sys
+import time
+import zlib
+import asyncio
+import threading
+import logging
+from html import escape
+from collections import Counter
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Кадры, в которых event loop ждет событий, а не работает
+IDLE_FUNCTIONS = {('selectors.py', 'select')}
+
+def _frame_label(code) -> str:
+    path = code.co_filename.replace(os.sep, '/').split('/')
+    return f"{'/'.join(path[-2:])}:{code.co_name}"
+
+class SamplingProfiler:
+    """Сэмплирующий профайлер потока event loop с группировкой по задачам asyncio"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = Counter()
+        self.idle_samples = 0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        """Начинает сэмплирование потока, в котором работает loop"""
+        self._loop = loop or asyncio.get_running_loop()
+        self._target_id = threading.get_ident()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target_id)
+            if frame is None:
+                continue
+
+            if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FUNCTIONS:
+                self.idle_samples += 1
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+
+            task = asyncio.tasks._current_tasks.get(self._loop)
+            if task is not None:
+                stack.insert(0, f"task:{task.get_coro().__qualname__}")
+
+            self.samples[';'.join(stack)] += 1
+
+    @property
+    def busy_samples(self) -> int:
+        return sum(self.samples.values())
+
+    def top(self, limit: int = 15) -> List[Tuple[str, float, float]]:
+        """Горячие функции: (функция, % собственного времени, % с вложенными вызовами)"""
+        total = self.busy_samples
+        if not total:
+            return []
+
+        own = Counter()
+        inclusive = Counter()
+        for stack, count in self.samples.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for label in set(frames):
+                inclusive[label] += count
+
+        return [
+            (label, 100 * count / total, 100 * inclusive[label] / total)
+            for label, count in own.most_common(limit)
+        ]
+
+    def folded(self) -> str:
+        """Стеки в свернутом формате (flamegraph.pl, speedscope)"""
+        return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def flamegraph_svg(self, width: int = 1200, row_height: int = 16) -> str:
+        """Самодостаточный SVG-флеймграф"""
+        tree: Dict = {"name": "all", "value": 0, "children": {}}
+        for stack, count in self.samples.items():
+            node = tree
+            node["value"] += count
+            for label in stack.split(';'):
+                node = node["children"].setdefault(label, {"name": label, "value": 0, "children": {}})
+                node["value"] += count
+
+        total = tree["value"] or 1
+        rects = []
+
+        def layout(node, x: float, depth: int):
+            node_width = width * node["value"] / total
+            if node_width < 0.5:
+                return
+            y = depth * row_height
+            name = escape(node["name"])
+            hue = 20 + zlib.crc32(node["name"].split(':')[0].encode()) % 40
+            label = name if node_width > 7 * len(name) else name[:max(0, int(node_width / 7) - 2)]
+            rects.append(
+                f'<g><title>{name} ({node["value"]} сэмплов, {100 * node["value"] / total:.1f}%)</title>'
+                f'<rect x="{x:.1f}" y="{y}" width="{node_width:.1f}" height="{row_height - 1}" '
+                f'fill="hsl({hue},90%,60%)"/>'
+                f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">{label}</text></g>'
+            )
+            child_x = x
+            for child in sorted(node["children"].values(), key=lambda c: c["name"]):
+                layout(child, child_x, depth + 1)
+                child_x += width * child["value"] / total
+
+        layout(tree, 0.0, 0)
+        depth = 1 + max((stack.count(';') + 1 for stack in self.samples), default=0)
+
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{depth * row_height}" '
+            f'font-family="monospace" font-size="11">{"".join(rects)}</svg>'
+        )
+
+    def report(self, limit: int = 15) -> str:
+        """Текстовый отчет для отправки администратору"""
+        total = self.busy_samples + self.idle_samples
+        busy = 100 * self.busy_samples / total if total else 0.0
+
+        lines = [
+            f"🔬 Профиль за {self.duration:.1f} с: {total} сэмплов, event loop занят {busy:.1f}%",
+            "",
+            "Горячие функции (собств. % / с вложенными %):",
+        ]
+        for label, own, inclusive in self.top(limit):
+            lines.append(f"{own:5.1f}% / {inclusive:5.1f}%  {label}")
+        return '\n'.join(lines)
+
+_running = False
+
+async def profile_for(seconds: float, interval: float = 0.01) -> SamplingProfiler:
+    """Профилирует работающий event loop заданное время; одновременно только один профайлер"""
+    global _running
+    if _running:
+        raise RuntimeError("Профайлер уже запущен")
+
+    _running = True
+    profiler = SamplingProfiler(interval)
+    try:
+        profiler.start()
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+        _running = False
+
+    logger.info(f"🔬 Профилирование завершено: {profiler.busy_samples} рабочих сэмплов")
+    return profiler
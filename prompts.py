@@ -48,7 +48,7 @@ class Prompts:
 
 *Начнем? Нажмите "🎯 Рекомендации"!*""",
         
-        "ask_preferences": """✨ *Расскажите, что вы любите делать в свободное время?*
+        "ask_preferences": """✨ *Выберите категории кнопками ниже или расскажите, что вы любите делать в свободное время.*
 
 *Например:*
 • Люблю ходить в музеи и на выставки
@@ -67,7 +67,39 @@ class Prompts:
 • 'Хочу сходить в хороший ресторан'
 • 'Ищу места для прогулок в парках'""",
         
-        "error": "❌ *Произошла ошибка. Попробуйте позже.*"
+        "error": "❌ *Произошла ошибка. Попробуйте позже.*",
+        
+        "search_usage": """🔎 *Поиск мест*
+
+Напишите запрос после команды, например:
+• /search музей космонавтики
+• /search театр балета""",
+        
+        "review_usage": """⭐ *Отзыв о месте*
+
+Формат: /review <ID места> <оценка 1-5> [текст]
+Например: /review 12 5 Отличная экспозиция
+
+ID места можно узнать через /search""",
+        
+        "import_usage": """📥 *Импорт ссылок*
+
+Отправьте файл CSV или JSON (до 1 МБ).
+
+CSV: строки `категория,url`
+JSON: `[{"category": "Музеи", "url": "https://..."}]`
+
+Категорию можно указывать без эмодзи. Ссылки будут проверены на доступность.""",
+        
+        "no_saved_preferences": """🤷 *Я пока не знаю ваших интересов.*
+
+Нажмите "🎯 Рекомендации" и расскажите, что вам нравится - в следующий раз хватит одной кнопки "🔁 Мои интересы".""",
+        
+        "no_selected_categories": "Отметьте хотя бы одну категорию",
+        
+        "location_saved": """📍 *Геопозиция сохранена.*
+
+Теперь рекомендации будут из мест рядом с вами. Нажмите "🎯 Рекомендации" и выберите, что вам интересно."""
     }
 
 prompts = Prompts()
\ No newline at end of file
@@ -0,0 +1,153 @@
+import asyncio
+import time
+import logging
+from collections import deque
+from typing import Dict, Any, List, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import config
+from metrics import STAGE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+class MessageSender:
+    """Очередь исходящих сообщений с учетом лимитов Telegram"""
+
+    MERGEABLE_KWARGS = {'parse_mode', 'reply_markup'}
+
+    def __init__(self, bot: Bot, global_rate: float = None, chat_interval: float = None,
+                 max_length: int = 4000, max_retries: int = 5):
+        self.bot = bot
+        self.global_interval = 1 / (global_rate or config.SEND_GLOBAL_RATE)
+        self.chat_interval = chat_interval if chat_interval is not None else config.SEND_CHAT_INTERVAL
+        self.max_length = max_length
+        self.max_retries = max_retries
+
+        self._queues: Dict[int, deque] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._global_lock = asyncio.Lock()
+        self._global_next = 0.0
+
+        self.sent = 0
+        self.merged = 0
+        self.retries = 0
+        self.failed = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Количество сообщений, ожидающих отправки"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика очереди"""
+        return {
+            "queue_depth": self.queue_depth,
+            "active_chats": len(self._workers),
+            "sent": self.sent,
+            "merged": self.merged,
+            "retries": self.retries,
+            "failed": self.failed,
+        }
+
+    def enqueue(self, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+        """Ставит сообщение в очередь, возвращает future с отправленным Message"""
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(chat_id, deque()).append((text, kwargs, [future]))
+
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._drain(chat_id))
+
+        return future
+
+    async def send(self, chat_id: int, text: str, **kwargs):
+        """Отправляет сообщение через очередь и ждет результата"""
+        return await self.enqueue(chat_id, text, **kwargs)
+
+    async def send_many(self, chat_id: int, texts: List[str], **kwargs) -> list:
+        """Ставит несколько частей подряд, чтобы короткие можно было склеить"""
+        futures = [self.enqueue(chat_id, text, **kwargs) for text in texts]
+        return await asyncio.gather(*futures)
+
+    async def close(self):
+        """Дожидается отправки всех сообщений из очереди"""
+        if self._workers:
+            await asyncio.gather(*self._workers.values(), return_exceptions=True)
+
+    def _can_merge(self, text: str, kwargs: Dict[str, Any], item: Tuple) -> bool:
+        next_text, next_kwargs, _ = item
+
+        if kwargs.get('reply_markup') is not None:
+            return False
+        if set(kwargs) - self.MERGEABLE_KWARGS or set(next_kwargs) - self.MERGEABLE_KWARGS:
+            return False
+        if kwargs.get('parse_mode') != next_kwargs.get('parse_mode'):
+            return False
+
+        return len(text) + len(next_text) + 2 <= self.max_length
+
+    def _pop_batch(self, queue: deque) -> Tuple[str, Dict[str, Any], list]:
+        """Забирает из очереди сообщение, склеивая его со следующими, если влезает"""
+        text, kwargs, futures = queue.popleft()
+
+        while queue and self._can_merge(text, kwargs, queue[0]):
+            next_text, next_kwargs, next_futures = queue.popleft()
+            text = f"{text}\n\n{next_text}"
+            kwargs = next_kwargs
+            futures = futures + next_futures
+            self.merged += 1
+
+        return text, kwargs, futures
+
+    async def _acquire_global(self):
+        """Глобальный лимит: не больше global_rate сообщений в секунду"""
+        async with self._global_lock:
+            now = time.monotonic()
+            wait = self._global_next - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._global_next = max(now, self._global_next) + self.global_interval
+
+    async def _send_with_retry(self, chat_id: int, text: str, kwargs: Dict[str, Any]):
+        for attempt in range(1, self.max_retries + 1):
+            await self._acquire_global()
+            try:
+                with STAGE_LATENCY.labels('telegram_send').time():
+                    result = await self.bot.send_message(chat_id, text, **kwargs)
+                self.sent += 1
+                return result
+            except TelegramRetryAfter as e:
+                self.retries += 1
+                logger.warning(
+                    f"⚠️ Flood control для чата {chat_id}: ждем {e.retry_after} с "
+                    f"(попытка {attempt}/{self.max_retries}, в очереди {self.queue_depth})"
+                )
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+    async def _drain(self, chat_id: int):
+        """Последовательно отправляет сообщения одного чата с учетом лимита на чат"""
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                text, kwargs, futures = self._pop_batch(queue)
+                try:
+                    result = await self._send_with_retry(chat_id, text, kwargs)
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"❌ Ошибка отправки в чат {chat_id}: {e}")
+                    for future in futures:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for future in futures:
+                        if not future.done():
+                            future.set_result(result)
+
+                # Пауза после отправки; новые сообщения за это время будут склеены
+                await asyncio.sleep(self.chat_interval)
+        finally:
+            del self._queues[chat_id]
+            del self._workers[chat_id]
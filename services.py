@@ -1,77 +1,277 @@
 import redis
 import json
 import hashlib
+import codecs
 import asyncio
+import time
+import threading
 import aiohttp
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Union, Optional
 from config import config
 from prompts import prompts
-from database import Session, Place, User, Review
-from bs4 import BeautifulSoup
+from database import Session, Place, User, Review, StatsCounter, STATS_AGGREGATE_SQL, STATS_COUNTERS
+from disk_store import get_disk_store
+from cache_codec import CacheCodec
+from fingerprint import simhash, page_fingerprints, fingerprints_match
+from mistral_client import fallback_category_detection
+from geo import GeoIndex, find_coordinates, city_coordinates, geocode, geohash
+from metrics import STAGE_LATENCY, FETCH_LATENCY, FETCH_TOTAL, CACHE_REQUESTS, CACHE_STORED_BYTES, CACHE_BYTES_SAVED, REC_GENERATIONS, host_label
+from urllib.parse import urlparse, urljoin
 import re
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
 import logging
 
-from mistral_client import MistralClient
-
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+try:
+    import brotli  # noqa: F401 - aiohttp распаковывает br, только если модуль установлен
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
 class CacheService:
-    def __init__(self):
+    # Префиксы, которые дублируются на диск и переживают перезапуск или очистку Redis
+    PERSISTENT_PREFIXES = ('rec', 'recfp', 'page')
+    # Все префиксы кэша; clear_all удаляет только их, счетчики usage: и версия ролей остаются
+    CACHE_PREFIXES = ('pref', 'rec', 'recfp', 'page', 'lock')
+    
+    # После неудачного подключения следующая попытка не раньше чем через столько секунд
+    RECONNECT_INTERVAL = 30
+    
+    def __init__(self, enabled: bool = True):
+        self._redis = None
+        # Отключенный кэш ведет себя как недоступный Redis
+        self._enabled = enabled
+        self._next_attempt = 0.0
+        self._connect_lock = threading.Lock()
+        self.codec = CacheCodec()
+    
+    @property
+    def disk(self):
+        """Дисковое хранилище открывается при первом обращении, а не при импорте"""
+        return get_disk_store() if self._enabled else None
+    
+    @property
+    def redis(self):
+        """Подключается к Redis при первом обращении; после неудачи пробует снова через RECONNECT_INTERVAL"""
+        if self._redis is not None or not self._enabled or time.monotonic() < self._next_attempt:
+            return self._redis
+        
+        # Пока один поток (например, прогрев) подключается, остальные ждут результат, а не получают None
+        with self._connect_lock:
+            if self._redis is None and time.monotonic() >= self._next_attempt:
+                self._connect()
+        return self._redis
+    
+    def _connect(self):
         try:
-            self.redis = redis.Redis(
+            client = redis.Redis(
                 host=config.REDIS_HOST,
                 port=config.REDIS_PORT,
-                decode_responses=True
+                decode_responses=True,
+                socket_connect_timeout=2
             )
-            self.redis.ping()
+            client.ping()
+            self._redis = client
             logger.info("✅ Redis подключен")
-        except redis.ConnectionError:
-            logger.warning("⚠️ Redis не подключен. Кэш отключен.")
-            self.redis = None
+        except (redis.ConnectionError, redis.TimeoutError):
+            self._next_attempt = time.monotonic() + self.RECONNECT_INTERVAL
+            logger.warning(f"⚠️ Redis не подключен. Кэш отключен, повтор через {self.RECONNECT_INTERVAL} с.")
     
     def get_cache_key(self, prefix: str, query: str) -> str:
         query_hash = hashlib.md5(query.encode()).hexdigest()
         return f"{prefix}:{query_hash}"
     
+    def _is_persistent(self, key: str) -> bool:
+        return self.disk is not None and key.split(':', 1)[0] in self.PERSISTENT_PREFIXES
+    
+    def _get_raw(self, key: str):
+        """Redis, затем диск; найденное на диске возвращается в Redis на оставшийся TTL"""
+        prefix = key.split(':', 1)[0]
+        
+        data = self.redis.get(key) if self.redis else None
+        if data:
+            CACHE_REQUESTS.labels(prefix, 'hit').inc()
+            return data
+        
+        if self._is_persistent(key):
+            stored = self.disk.get(key)
+            if stored:
+                data, ttl_left = stored
+                if self.redis:
+                    self.redis.setex(key, max(1, int(ttl_left)), data)
+                CACHE_REQUESTS.labels(prefix, 'disk_hit').inc()
+                return data
+        
+        CACHE_REQUESTS.labels(prefix, 'miss').inc()
+        return None
+    
+    def _set_raw(self, key: str, data: str, ttl: int):
+        if self.redis:
+            self.redis.setex(key, ttl, data)
+        if self._is_persistent(key):
+            self.disk.set(key, data, ttl)
+    
+    def _encode(self, key: str, value) -> str:
+        """Кодирует значение и учитывает в метриках, сколько байт сэкономил кодек против прежнего json.dumps"""
+        prefix = key.split(':', 1)[0]
+        encoded = self.codec.encode(value)
+        stored = len(encoded.encode())
+        CACHE_STORED_BYTES.labels(prefix, self.codec.codec_name(encoded)).inc(stored)
+        # Прежний формат - json.dumps с \uXXXX, то есть только ASCII: символы равны байтам
+        CACHE_BYTES_SAVED.labels(prefix).inc(max(0, len(json.dumps(value)) - stored))
+        return encoded
+    
     def get(self, key: str):
-        if not self.redis:
-            return None
-        data = self.redis.get(key)
-        return json.loads(data) if data else None
+        data = self._get_raw(key)
+        return self.codec.decode(data) if data else None
     
     def set(self, key: str, data, ttl: int = 300):
-        if self.redis:
-            self.redis.setex(key, ttl, json.dumps(data))
+        self._set_raw(key, self._encode(key, data), ttl)
     
-    def set_url_content(self, url: str, content: str, ttl: int = 3600):
-        if self.redis:
-            key = f"url:{hashlib.md5(url.encode()).hexdigest()}"
-            self.redis.setex(key, ttl, content)
+    def get_swr(self, key: str) -> Tuple[Any, bool]:
+        """Значение и признак устаревания (мягкий срок прошел, жесткий еще нет)"""
+        data = self.get(key)
+        if data is None:
+            return None, False
+        
+        # Записи без мягкого срока остались от прежнего формата и считаются свежими
+        if not (isinstance(data, dict) and "soft_expires_at" in data):
+            return data, False
+        
+        stale = time.time() >= data["soft_expires_at"]
+        if stale:
+            CACHE_REQUESTS.labels(key.split(':', 1)[0], 'stale').inc()
+        return data["value"], stale
     
-    def get_url_content(self, url: str):
+    def set_swr(self, key: str, value, fresh_ttl: int, stale_ttl: int):
+        """Запись живет fresh_ttl + stale_ttl; после fresh_ttl get_swr помечает ее устаревшей"""
+        self.set(key, {"value": value, "soft_expires_at": time.time() + fresh_ttl}, fresh_ttl + stale_ttl)
+    
+    def try_lock(self, key: str, ttl: int) -> bool:
+        """Короткая блокировка между процессами; без Redis всегда успешна"""
         if not self.redis:
-            return None
-        key = f"url:{hashlib.md5(url.encode()).hexdigest()}"
-        return self.redis.get(key)
+            return True
+        return bool(self.redis.set(f"lock:{key}", "1", nx=True, ex=ttl))
+    
+    def get_page(self, url: str):
+        """Распарсенная страница из кэша"""
+        return self.get(f"page:{hashlib.md5(url.encode()).hexdigest()}")
+    
+    def set_page(self, url: str, parsed: Dict[str, Any], ttl: int = 3600):
+        self.set(f"page:{hashlib.md5(url.encode()).hexdigest()}", parsed, ttl)
     
     def clear_all(self):
-        """Очищает весь кэш Redis"""
+        """Очищает ключи кэша в Redis и дисковое хранилище"""
+        if self.disk:
+            self.disk.clear()
         if self.redis:
-            self.redis.flushall()
+            for prefix in self.CACHE_PREFIXES:
+                self._delete_prefix(prefix)
             return True
-        return False
+        return self.disk is not None
+    
+    def _delete_prefix(self, prefix: str, batch_size: int = 1000):
+        """SCAN вместо KEYS, чтобы не блокировать Redis на большой базе"""
+        batch = []
+        for key in self.redis.scan_iter(match=f"{prefix}:*", count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                self.redis.unlink(*batch)
+                batch = []
+        if batch:
+            self.redis.unlink(*batch)
+
+class UsageStats:
+    """Дневные счетчики использования в Redis-хешах usage:<дата>"""
+    
+    RETENTION_DAYS = 35
+    
+    def __init__(self, cache: CacheService):
+        self.cache = cache
+    
+    @staticmethod
+    def _day_key(day: datetime) -> str:
+        return f"usage:{day.strftime('%Y-%m-%d')}"
+    
+    def incr(self, *fields: str):
+        """Увеличивает поля сегодняшнего хеша одним запросом; ошибки Redis не мешают ответу пользователю"""
+        if not fields or not self.cache.redis:
+            return
+        
+        key = self._day_key(datetime.utcnow())
+        try:
+            pipe = self.cache.redis.pipeline(transaction=False)
+            for field in fields:
+                pipe.hincrby(key, field, 1)
+            pipe.expire(key, self.RETENTION_DAYS * 24 * 3600)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"⚠️ Не удалось записать статистику использования: {e}")
+    
+    def get_days(self, days: int = 7) -> List[Tuple[str, Dict[str, int]]]:
+        """Счетчики за последние дни, от сегодняшнего к более ранним"""
+        if not self.cache.redis:
+            return []
+        
+        today = datetime.utcnow()
+        dates = [today - timedelta(days=i) for i in range(days)]
+        pipe = self.cache.redis.pipeline(transaction=False)
+        for day in dates:
+            pipe.hgetall(self._day_key(day))
+        try:
+            results = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"⚠️ Не удалось прочитать статистику использования: {e}")
+            return []
+        
+        return [
+            (day.strftime('%d.%m'), {field: int(value) for field, value in counters.items()})
+            for day, counters in zip(dates, results)
+        ]
+    
+    def summary(self, days: int = 7) -> Dict[str, Any]:
+        """Запросы по категориям, доля попаданий в кэш рекомендаций и вызовы LLM по дням"""
+        per_day = self.get_days(days)
+        totals = {}
+        for _, counters in per_day:
+            for field, value in counters.items():
+                totals[field] = totals.get(field, 0) + value
+        
+        rec_requests = sum(totals.get(f"rec:{result}", 0) for result in ('hit', 'stale', 'miss'))
+        return {
+            "days": days,
+            "available": bool(per_day),
+            "categories": sorted(
+                ((field.split(':', 1)[1], value) for field, value in totals.items() if field.startswith('category:')),
+                key=lambda item: item[1],
+                reverse=True
+            ),
+            "rec_requests": rec_requests,
+            "cache_hit_rate": (totals.get('rec:hit', 0) + totals.get('rec:stale', 0)) / rec_requests if rec_requests else 0.0,
+            "rec_reused": totals.get('rec:reused', 0),
+            "llm_calls_by_day": [
+                (day, sum(value for field, value in counters.items() if field.startswith('llm:')))
+                for day, counters in per_day
+            ],
+        }
 
 class WebParser:
     """Асинхронный парсер веб-сайтов"""
     
-    def __init__(self):
+    META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?\s*([\w\-]+)', re.IGNORECASE)
+    SNIFF_BYTES = 4096
+    
+    def __init__(self, user_agent: str = None):
         self.session = None
         self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'User-Agent': user_agent or 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept': 'text/html,application/xhtml+xml',
             'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+            'Accept-Encoding': ACCEPT_ENCODING,
         }
     
     async def __aenter__(self):
@@ -86,26 +286,88 @@ class WebParser:
         if self.session:
             await self.session.close()
     
-    async def fetch_url(self, url: str) -> str:
-        """Асинхронно загружает страницу"""
+    async def fetch_page(self, url: str) -> Tuple[bytes, str]:
+        """Асинхронно загружает страницу, возвращает тело и кодировку"""
+        host = host_label(url)
+        started = time.perf_counter()
         try:
             async with self.session.get(url, timeout=10, ssl=False) as response:
+                FETCH_TOTAL.labels(host, str(response.status)).inc()
                 if response.status == 200:
-                    return await response.text()
+                    body = await response.read()
+                    return body, self._detect_encoding(body, response.charset)
                 else:
                     logger.warning(f"⚠️ Ошибка загрузки {url}: статус {response.status}")
-                    return ""
+                    return b"", None
         except Exception as e:
+            FETCH_TOTAL.labels(host, 'error').inc()
             logger.error(f"❌ Ошибка загрузки {url}: {e}")
-            return ""
+            return b"", None
+        finally:
+            elapsed = time.perf_counter() - started
+            FETCH_LATENCY.labels(host).observe(elapsed)
+            STAGE_LATENCY.labels('fetch_url').observe(elapsed)
     
-    def parse_page_content(self, html: str, url: str) -> Dict[str, Any]:
-        """Парсит контент страницы"""
+    async def fetch_url(self, url: str) -> str:
+        """Асинхронно загружает страницу как текст"""
+        body, encoding = await self.fetch_page(url)
+        return body.decode(encoding, errors='replace') if body else ""
+    
+    def _detect_encoding(self, body: bytes, header_charset: str = None) -> str:
+        """Кодировка из заголовка, затем из <meta>, и только потом детект по началу тела"""
+        for candidate in (header_charset, self._find_meta_charset(body)):
+            encoding = self._normalize_encoding(candidate)
+            if encoding:
+                return encoding
+        
+        prefix = body[:self.SNIFF_BYTES]
+        try:
+            prefix.decode('utf-8')
+            return 'utf-8'
+        except UnicodeDecodeError as e:
+            # Префикс мог обрезать многобайтовый символ на границе
+            if e.start >= len(prefix) - 3 and len(body) > len(prefix):
+                return 'utf-8'
+        
+        try:
+            from charset_normalizer import from_bytes
+            
+            match = from_bytes(prefix).best()
+            if match:
+                return match.encoding
+        except ImportError:
+            pass
+        
+        return 'cp1251'
+    
+    def _find_meta_charset(self, body: bytes) -> str:
+        match = self.META_CHARSET_RE.search(body[:self.SNIFF_BYTES])
+        return match.group(1).decode('ascii') if match else None
+    
+    def _normalize_encoding(self, encoding: str) -> str:
+        if not encoding:
+            return None
+        try:
+            return codecs.lookup(encoding).name
+        except LookupError:
+            return None
+    
+    def parse_page_content(self, html: Union[str, bytes], url: str, encoding: str = None,
+                           include_links: bool = False) -> Dict[str, Any]:
+        """Парсит контент страницы (строку или байты с известной кодировкой)"""
         try:
             if not html:
                 return {"url": url, "content": "", "title": "Ошибка загрузки"}
             
-            soup = BeautifulSoup(html, 'html.parser')
+            from bs4 import BeautifulSoup
+            
+            if isinstance(html, bytes):
+                soup = BeautifulSoup(html, 'lxml', from_encoding=encoding)
+            else:
+                soup = BeautifulSoup(html, 'lxml')
+            
+            # Ссылки собираем до удаления навигации: разделы вроде афиши обычно именно там
+            links = self._extract_links(soup, url) if include_links else None
             
             for tag in soup(['script', 'style', 'nav', 'footer', 'header', 'iframe']):
                 tag.decompose()
@@ -115,13 +377,17 @@ class WebParser:
             contacts = self._extract_contacts(content)
             clean_content = self._clean_text(content)
             
-            return {
+            result = {
                 "url": url,
                 "title": title,
                 "content": clean_content[:3000],
+                "fingerprint": simhash(clean_content[:3000]),
                 "contacts": contacts,
                 "timestamp": datetime.now().isoformat()
             }
+            if links is not None:
+                result["links"] = links
+            return result
             
         except Exception as e:
             logger.error(f"❌ Ошибка парсинга {url}: {e}")
@@ -152,6 +418,15 @@ class WebParser:
         
         return url.split('//')[-1].split('/')[0].replace('www.', '').capitalize()
     
+    def _extract_links(self, soup, url: str) -> List[Tuple[str, str]]:
+        """Абсолютные ссылки страницы с текстом анкора"""
+        links = []
+        for anchor in soup.find_all('a', href=True):
+            href = anchor['href'].strip()
+            if href and not href.startswith(('#', 'mailto:', 'tel:', 'javascript:')):
+                links.append((urljoin(url, href).split('#')[0], anchor.get_text(' ', strip=True)[:100]))
+        return links
+    
     def _extract_main_content(self, soup) -> str:
         content_selectors = [
             'main',
@@ -173,11 +448,13 @@ class WebParser:
         texts = [p.get_text().strip() for p in paragraphs if len(p.get_text().strip()) > 20]
         return ' '.join(texts[:10])
     
-    def _extract_contacts(self, text: str) -> Dict[str, str]:
+    def _extract_contacts(self, text: str) -> Dict[str, Any]:
         contacts = {
             "address": self._find_pattern(text, r'ул\.?\s+[\w\s\d\-]+,\s*\d+|[А-Яа-я][^,\n]{10,50},\s*\d+'),
             "phone": self._find_pattern(text, r'\+7\s?\(?\d{3}\)?\s?\d{3}[\s\-]?\d{2}[\s\-]?\d{2}'),
             "email": self._find_pattern(text, r'[\w\.-]+@[\w\.-]+\.\w+'),
+            # Пара чисел, а не строка: str(55.7500) = '55.75' уже не прошла бы COORDINATES_RE
+            "coordinates": find_coordinates(text),
         }
         
         return {k: v if v else "Не указано" for k, v in contacts.items()}
@@ -192,11 +469,35 @@ class WebParser:
         return text.strip()
 
 class LLMService:
-    def __init__(self):
-        self.client = MistralClient()
-        self.cache = CacheService()
-        self.url_database = config.URL_DATABASE
+    def __init__(self, client=None, cache: CacheService = None, url_database: Dict[str, List[str]] = None):
+        self._client = client
+        self._client_lock = threading.Lock()
+        self.cache = cache or CacheService()
+        self.url_database = url_database or config.URL_DATABASE
+        self._source_ranking = None
+        self._source_ranking_at = 0.0
+        # Идущие генерации по ключу кэша: одновременные запросы ждут одну и ту же
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.usage = UsageStats(self.cache)
+        self._source_indexes = None
+        self._source_indexes_at = 0.0
+    
+    @property
+    def client(self):
+        """Клиент LLM создается при первом запросе, чтобы не грузить SDK на старте"""
+        if self._client is None:
+            # Один роутер (и один пул потоков) на сервис, даже если прогрев и хендлер пришли вместе
+            with self._client_lock:
+                if self._client is None:
+                    from llm_router import build_default_router
+                    self._client = build_default_router()
+        return self._client
     
+    def warmup(self):
+        """Заранее поднимает соединения и SDK (вызывается в фоне после старта)"""
+        self.cache.redis
+        self.client
+
     def analyze_preferences(self, text: str) -> Dict[str, Any]:
         """Анализирует предпочтения"""
         cache_key = self.cache.get_cache_key("pref", text)
@@ -206,70 +507,555 @@ class LLMService:
             return cached
         
         categories = list(self.url_database.keys())
-        result = self.client.analyze_preferences(text, categories)
+        try:
+            with STAGE_LATENCY.labels('analyze_preferences').time():
+                result = self.client.analyze_preferences(text, categories)
+        except Exception as e:
+            # Все бэкенды отказали: разбор по ключевым словам, в кэш не пишем
+            logger.error(f"❌ LLM не ответила при анализе предпочтений: {e}")
+            return fallback_category_detection(text, categories)
+        self.usage.incr('llm:analyze_preferences')
         
         self.cache.set(cache_key, result, ttl=1800)
         return result
     
-    async def get_recommendations(self, categories: List[str]) -> str:
-        """Получает рекомендации"""
-        cache_key = self.cache.get_cache_key("rec", str(categories))
+    async def get_recommendations(self, categories: List[str], location: Tuple[float, float] = None) -> str:
+        """Получает рекомендации (рядом с location, если задано); устаревшие отдаются сразу, а обновляются в фоне"""
+        # Пользователи из одной ячейки геохеша (~20 км) делят кэш
+        scope = str(categories) + (f"@{geohash(*location, config.GEO_CACHE_PRECISION)}" if location else "")
+        cache_key = self.cache.get_cache_key("rec", scope)
         
-        cached = self.cache.get(cache_key)
+        cached, stale = self.cache.get_swr(cache_key)
+        self.usage.incr(
+            f"rec:{'miss' if not cached else 'stale' if stale else 'hit'}",
+            *(f"category:{category}" for category in categories)
+        )
         if cached:
+            if stale and cache_key not in self._inflight and self.cache.try_lock(cache_key, 300):
+                logger.info(f"♻️ Фоновое обновление рекомендаций {cache_key}")
+                self._generate_once(cache_key, scope, categories, location)
             return cached
         
-        urls_to_parse = []
-        for category in categories:
-            if category in self.url_database:
-                urls_to_parse.extend(self.url_database[category][:3])
+        # shield: отмена одного хендлера не должна прерывать генерацию, которую ждут другие
+        return await asyncio.shield(self._generate_once(cache_key, scope, categories, location))
+    
+    def _generate_once(self, cache_key: str, scope: str, categories: List[str], location: Tuple[float, float] = None) -> asyncio.Task:
+        """Одна генерация на ключ в процессе, сколько бы запросов ее ни ждало"""
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.create_task(self._generate_recommendations(cache_key, scope, categories, location))
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda done: self._on_generated(cache_key, done))
+        return task
+    
+    def _on_generated(self, cache_key: str, task: asyncio.Task):
+        self._inflight.pop(cache_key, None)
+        if not task.cancelled() and task.exception():
+            logger.error(f"❌ Ошибка генерации рекомендаций {cache_key}: {task.exception()}")
+    
+    async def _generate_recommendations(self, cache_key: str, scope: str, categories: List[str],
+                                        location: Tuple[float, float] = None) -> str:
+        """Загрузка источников и генерация текста LLM с записью в кэш"""
+        urls_to_parse = await self._select_sources(categories, location)
         
         if not urls_to_parse:
             return "К сожалению, по выбранным категориям нет информации."
         
         parsed_data = await self._parse_urls_async(urls_to_parse)
-        recommendations = self.client.generate_recommendations(parsed_data, categories)
+        parsed_data.extend(await self._get_crawled_subpages(urls_to_parse))
+        if not parsed_data:
+            # Сайты недоступны: не кэшируем пустой ответ и не запоминаем отпечатки
+            return "Не удалось получить информацию с сайтов."
         
-        self.cache.set(cache_key, recommendations, ttl=3600)
+        # Источники не изменились по существу - продлеваем прошлый текст вместо вызова LLM
+        fingerprint_key = self.cache.get_cache_key("recfp", scope)
+        fingerprints = page_fingerprints(parsed_data)
+        previous = self.cache.get(fingerprint_key)
+        
+        if previous and fingerprints_match(previous["fingerprints"], fingerprints, config.SIMHASH_MAX_DISTANCE):
+            logger.info(f"🧬 Источники {cache_key} не изменились, рекомендации продлены без LLM")
+            REC_GENERATIONS.labels('reused').inc()
+            self.usage.incr('rec:reused')
+            recommendations = previous["recommendations"]
+        else:
+            try:
+                with STAGE_LATENCY.labels('generate_recommendations').time():
+                    # В потоке: фоновое обновление не должно блокировать event loop на время ответа LLM
+                    recommendations = await asyncio.to_thread(self.client.generate_recommendations, parsed_data, categories)
+            except Exception as e:
+                # Ошибку не кэшируем: следующий запрос снова попробует LLM, устаревший текст остается в кэше
+                logger.error(f"❌ LLM не ответила при генерации рекомендаций {cache_key}: {e}")
+                REC_GENERATIONS.labels('failed').inc()
+                return "Не удалось сформировать рекомендации."
+            REC_GENERATIONS.labels('generated').inc()
+            self.usage.incr('llm:generate_recommendations')
+            self.cache.set(
+                fingerprint_key,
+                {"fingerprints": fingerprints, "recommendations": recommendations},
+                ttl=config.REC_FINGERPRINT_TTL
+            )
+        
+        self.cache.set_swr(cache_key, recommendations, config.REC_FRESH_TTL, config.REC_STALE_TTL)
         return recommendations
     
-    async def _parse_urls_async(self, urls: List[str]) -> List[Dict[str, Any]]:
-        """Асинхронно парсит список URL"""
-        parsed_results = []
+    async def _select_sources(self, categories: List[str], location: Tuple[float, float] = None) -> List[str]:
+        """Выбирает ближайшие к location источники каждой категории, без него - лучшие по рейтингу мест"""
+        ranking = await self._get_source_ranking()
         
-        async with WebParser() as parser:
-            tasks = [parser.fetch_url(url) for url in urls]
-            html_contents = await asyncio.gather(*tasks, return_exceptions=True)
+        def rank(url: str) -> float:
+            return ranking.get(url.rstrip('/'), config.RATING_PRIOR_MEAN)
+        
+        if location:
+            indexes = await self._get_source_indexes()
+            urls = []
+            for category in categories:
+                if category in indexes:
+                    # Источники без мест стоят в центре своего города и равноудалены: среди равных по
+                    # расстоянию (с точностью до км) решает рейтинг, а не порядок в URL_DATABASE
+                    candidates = indexes[category].nearest(location, indexes[category].size)
+                    candidates.sort(key=lambda item: (round(item[0]), -rank(item[1])))
+                    urls.extend(url for _, url in candidates[:config.SOURCES_PER_CATEGORY])
+            return urls
+        
+        
+        urls = []
+        for category in categories:
+            if category in self.url_database:
+                ranked = sorted(self.url_database[category], key=rank, reverse=True)
+                urls.extend(ranked[:config.SOURCES_PER_CATEGORY])
+        return urls
+    
+    async def _get_source_ranking(self) -> Dict[str, float]:
+        """Рейтинг источников из БД с кэшированием в памяти"""
+        now = time.monotonic()
+        if self._source_ranking is None or now - self._source_ranking_at > config.SOURCE_RANKING_TTL:
+            try:
+                self._source_ranking = await asyncio.to_thread(ReviewService.get_source_ranking)
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось загрузить рейтинг источников: {e}")
+                self._source_ranking = self._source_ranking or {}
+            self._source_ranking_at = now
+        return self._source_ranking
+    
+    async def _get_source_indexes(self) -> Dict[str, GeoIndex]:
+        """Геоиндекс источников по категориям, перестраивается вместе с рейтингом"""
+        now = time.monotonic()
+        if self._source_indexes is None or now - self._source_indexes_at > config.SOURCE_RANKING_TTL:
+            try:
+                locations = await asyncio.to_thread(GeoService.get_source_locations)
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось загрузить координаты источников: {e}")
+                locations = {}
             
-            for url, html in zip(urls, html_contents):
-                if isinstance(html, Exception):
-                    parsed_results.append({
-                        "url": url,
-                        "content": "",
-                        "title": "Ошибка загрузки"
-                    })
-                else:
-                    parsed = parser.parse_page_content(html, url)
-                    parsed_results.append(parsed)
-                    
-                    if parsed["content"]:
-                        self.cache.set_url_content(url, parsed["content"])
+            self._source_indexes = {}
+            for category, urls in self.url_database.items():
+                index = GeoIndex()
+                for url in urls:
+                    coordinates = locations.get(url.rstrip('/')) or GeoService.default_location(url)
+                    if coordinates:
+                        index.add(coordinates, url)
+                self._source_indexes[category] = index
+            self._source_indexes_at = now
+        return self._source_indexes
+    
+    def invalidate_source_ranking(self):
+        """Сбрасывает рейтинг источников после нового отзыва"""
+        self._source_ranking = None
+    
+    async def _parse_urls_async(self, urls: List[str]) -> List[Dict[str, Any]]:
+        """Асинхронно парсит список URL (страницы из кэша не загружаются повторно)"""
+        parsed_by_url = {}
+        for url in urls:
+            cached = self.cache.get_page(url)
+            if cached:
+                parsed_by_url[url] = cached
+        
+        to_fetch = [url for url in urls if url not in parsed_by_url]
         
+        if to_fetch:
+            async with WebParser() as parser:
+                tasks = [parser.fetch_page(url) for url in to_fetch]
+                pages = await asyncio.gather(*tasks, return_exceptions=True)
+                
+                for url, page in zip(to_fetch, pages):
+                    if isinstance(page, Exception):
+                        parsed_by_url[url] = {
+                            "url": url,
+                            "content": "",
+                            "title": "Ошибка загрузки"
+                        }
+                    else:
+                        body, encoding = page
+                        with STAGE_LATENCY.labels('parse_page_content').time():
+                            parsed = parser.parse_page_content(body, url, encoding)
+                        parsed_by_url[url] = parsed
+                        
+                        if parsed["content"]:
+                            self.cache.set_page(url, parsed)
+        
+        parsed_results = [parsed_by_url[url] for url in urls]
         successful = [p for p in parsed_results if p.get("content") and len(p["content"]) > 50]
-        logger.info(f"✅ Успешно распарсено {len(successful)} из {len(urls)} сайтов")
+        logger.info(
+            f"✅ Успешно распарсено {len(successful)} из {len(urls)} сайтов "
+            f"(из кэша: {len(urls) - len(to_fetch)})"
+        )
         return successful
     
+    async def _get_crawled_subpages(self, urls: List[str]) -> List[Dict[str, Any]]:
+        """Подстраницы источников, заранее собранные фоновым обходом (без сети)"""
+        if not config.CRAWL_ENABLED:
+            return []
+        
+        from crawler import CrawlStore
+        
+        try:
+            return await asyncio.to_thread(CrawlStore.subpages_for_sources, urls)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось загрузить подстраницы обхода: {e}")
+            return []
+    
     def get_available_categories(self) -> List[str]:
         """Возвращает список категорий"""
         return list(self.url_database.keys())
 
+class PreferenceService:
+    """Сохраненные категории пользователя для повторных рекомендаций без анализа"""
+    
+    @staticmethod
+    def save_categories(telegram_id: str, categories: List[str]):
+        with Session() as session:
+            session.query(User).filter_by(telegram_id=telegram_id).update(
+                {User.preferences: json.dumps(categories, ensure_ascii=False)}
+            )
+            session.commit()
+    
+    @staticmethod
+    def get_categories(telegram_id: str) -> List[str]:
+        with Session() as session:
+            preferences = session.query(User.preferences).filter_by(telegram_id=telegram_id).scalar()
+        
+        try:
+            categories = json.loads(preferences or '[]')
+        except ValueError:
+            return []
+        return categories if isinstance(categories, list) else []
+    
+    @staticmethod
+    def save_location(telegram_id: str, latitude: float, longitude: float):
+        with Session() as session:
+            session.query(User).filter_by(telegram_id=telegram_id).update(
+                {User.latitude: latitude, User.longitude: longitude}
+            )
+            session.commit()
+    
+    @staticmethod
+    def get_location(telegram_id: str) -> Optional[Tuple[float, float]]:
+        with Session() as session:
+            row = session.query(User.latitude, User.longitude).filter_by(telegram_id=telegram_id).first()
+        return (row.latitude, row.longitude) if row and row.latitude is not None else None
+
+class GeoService:
+    """Координаты источников для выбора ближайших"""
+    
+    SOURCE_LOCATIONS_SQL = text("""
+        SELECT rtrim(source_url, '/') AS url, avg(latitude) AS lat, avg(longitude) AS lon
+        FROM places
+        WHERE source_url IS NOT NULL AND latitude IS NOT NULL
+        GROUP BY 1
+    """)
+    
+    @staticmethod
+    def get_source_locations() -> Dict[str, Tuple[float, float]]:
+        """Центр мест каждого источника: url -> (широта, долгота)"""
+        with Session() as session:
+            return {row.url: (row.lat, row.lon) for row in session.execute(GeoService.SOURCE_LOCATIONS_SQL)}
+    
+    @staticmethod
+    def default_location(url: str) -> Optional[Tuple[float, float]]:
+        """Источник без геокодированных мест: город из настроек, иначе город по умолчанию"""
+        host = urlparse(url).netloc.lower().removeprefix('www.')
+        return city_coordinates(config.SOURCE_CITIES.get(host, config.DEFAULT_SOURCE_CITY))
+
+class SearchService:
+    """Поиск мест по полнотекстовому и триграммному индексам"""
+    
+    SEARCH_SQL = text("""
+        SELECT id, name, description, category, address, source_url, rating, review_count,
+               ts_rank_cd(search_vector, q) + similarity(name, :query) AS score
+        FROM places, websearch_to_tsquery('russian', :query) AS q
+        WHERE is_active AND (search_vector @@ q OR name % :query)
+        ORDER BY score DESC
+        LIMIT :limit
+    """)
+    
+    @staticmethod
+    def search(query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Возвращает места, отсортированные по релевантности"""
+        with Session() as session:
+            rows = session.execute(SearchService.SEARCH_SQL, {"query": query, "limit": limit})
+            return [dict(row._mapping) for row in rows]
+    
+    @staticmethod
+    def is_confident(results: List[Dict[str, Any]]) -> bool:
+        """Есть ли в выдаче уверенное совпадение"""
+        return bool(results) and results[0]["score"] >= config.SEARCH_MIN_SCORE
+
+class ReviewService:
+    """Отзывы и инкрементально поддерживаемый рейтинг мест"""
+    
+    # Агрегаты обновляются одной командой в той же транзакции, что и запись отзыва:
+    # правые части SET видят старые значения строки, поэтому гонок и AVG-сканов нет.
+    # Повторный отзыв того же пользователя меняет сумму на разницу оценок, а число отзывов - на 0
+    UPDATE_AGGREGATES_SQL = text("""
+        UPDATE places
+        SET rating_sum = rating_sum + :rating_delta,
+            review_count = coalesce(review_count, 0) + :count_delta,
+            rating = (rating_sum + :rating_delta)::float / (coalesce(review_count, 0) + :count_delta),
+            rank_score = (rating_sum + :rating_delta + :prior_mean * :prior_weight)::float
+                         / (coalesce(review_count, 0) + :count_delta + :prior_weight)
+        WHERE id = :place_id AND is_active
+        RETURNING name, rating, review_count
+    """)
+    
+    SOURCE_RANKING_SQL = text("""
+        SELECT rtrim(source_url, '/') AS url, MAX(rank_score) AS score
+        FROM places
+        WHERE is_active AND source_url IS NOT NULL AND review_count > 0
+        GROUP BY 1
+    """)
+    
+    @staticmethod
+    def submit_review(telegram_id: str, place_id: int, rating: int, review_text: str = "") -> Dict[str, Any]:
+        """Сохраняет отзыв (повторный заменяет прежний) и обновляет рейтинг места; None, если пользователь или место не найдены"""
+        with Session() as session:
+            user = session.query(User).filter_by(telegram_id=telegram_id).first()
+            if not user:
+                return None
+            
+            # Блокировка прежнего отзыва: параллельная замена не посчитает одну разницу дважды
+            previous = session.query(Review).filter_by(user_id=user.id, place_id=place_id).with_for_update().first()
+            
+            row = session.execute(ReviewService.UPDATE_AGGREGATES_SQL, {
+                "place_id": place_id,
+                "rating_delta": rating - (previous.rating or 0) if previous else rating,
+                "count_delta": 0 if previous else 1,
+                "prior_mean": config.RATING_PRIOR_MEAN,
+                "prior_weight": config.RATING_PRIOR_WEIGHT,
+            }).first()
+            if not row:
+                session.rollback()
+                return None
+            
+            if previous:
+                if (review_text or None) != previous.text:
+                    previous.text = review_text or None
+                    previous.is_moderated = False
+                previous.rating = rating
+            else:
+                # Два первых отзыва одновременно: второй упадет на уникальном индексе и откатит свои агрегаты
+                session.add(Review(user_id=user.id, place_id=place_id, text=review_text or None, rating=rating))
+            session.commit()
+            
+            logger.info(f"✅ Отзыв на место {place_id}: {rating}★, новый рейтинг {row.rating:.2f}")
+            return {**row._mapping, "updated": previous is not None}
+    
+    @staticmethod
+    def get_source_ranking() -> Dict[str, float]:
+        """Предрасчитанный рейтинг источников: url -> rank_score"""
+        with Session() as session:
+            return {row.url: row.score for row in session.execute(ReviewService.SOURCE_RANKING_SQL)}
+
+class SourceImportService:
+    """Массовый импорт источников: проверка, параллельный опрос сайтов и пакетная вставка"""
+    
+    MAX_ROWS = 5000
+    
+    @staticmethod
+    def parse_rows(raw: bytes, filename: str) -> List[Tuple[str, str]]:
+        """Читает строки (категория, url) из CSV или JSON"""
+        text_data = raw.decode('utf-8-sig')
+        
+        if filename.lower().endswith('.json'):
+            rows = []
+            for item in json.loads(text_data):
+                if isinstance(item, dict):
+                    rows.append((str(item.get('category', '')), str(item.get('url', ''))))
+                elif isinstance(item, (list, tuple)) and len(item) >= 2:
+                    rows.append((str(item[0]), str(item[1])))
+            return rows[:SourceImportService.MAX_ROWS]
+        
+        import csv
+        import io
+        
+        try:
+            dialect = csv.Sniffer().sniff(text_data[:2048], delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        rows = []
+        for row in csv.reader(io.StringIO(text_data), dialect):
+            if len(row) < 2 or row[1].strip().lower() == 'url':
+                continue
+            rows.append((row[0], row[1]))
+        return rows[:SourceImportService.MAX_ROWS]
+    
+    @staticmethod
+    def resolve_category(name: str) -> str:
+        """Категория по точному имени или по имени без эмодзи"""
+        name = name.strip()
+        if name in config.URL_DATABASE:
+            return name
+        
+        for category in config.URL_DATABASE:
+            if category.split(' ', 1)[-1].lower() == name.lower():
+                return category
+        return None
+    
+    @staticmethod
+    async def import_sources(rows: List[Tuple[str, str]]) -> Dict[str, Any]:
+        """Импортирует источники и возвращает отчет"""
+        from validators import is_valid_url
+        
+        started = time.perf_counter()
+        report = {"total": len(rows), "added": 0, "invalid": 0, "duplicates": 0, "unreachable": 0, "unparsed": 0, "errors": []}
+        
+        candidates = []
+        seen = set()
+        for line, (raw_category, raw_url) in enumerate(rows, start=1):
+            category = SourceImportService.resolve_category(raw_category)
+            url = raw_url.strip()
+            
+            if not category or not is_valid_url(url):
+                report["invalid"] += 1
+                report["errors"].append(f"строка {line}: неверная категория или URL")
+                continue
+            
+            key = (category, url.rstrip('/'))
+            if key in seen or AdminService.has_url(category, url):
+                report["duplicates"] += 1
+                continue
+            
+            seen.add(key)
+            candidates.append((category, url))
+        
+        semaphore = asyncio.Semaphore(config.IMPORT_CONCURRENCY)
+        
+        async with WebParser() as parser:
+            async def probe(category: str, url: str):
+                async with semaphore:
+                    body, encoding = await parser.fetch_page(url)
+                if not body:
+                    return None
+                parsed = await asyncio.to_thread(parser.parse_page_content, body, url, encoding)
+                return category, url, parsed
+            
+            probed = await asyncio.gather(*(probe(c, u) for c, u in candidates))
+        
+        reachable = []
+        for (category, url), result in zip(candidates, probed):
+            if result is None:
+                report["unreachable"] += 1
+                report["errors"].append(f"{url}: недоступен")
+            elif not result[2]["content"]:
+                # Страница не разобралась (или в ней нет текста): иначе появилось бы место "Ошибка парсинга"
+                report["unparsed"] += 1
+                report["errors"].append(f"{url}: не удалось извлечь текст страницы")
+            else:
+                reachable.append(result)
+        
+        if reachable:
+            added = await asyncio.to_thread(SourceImportService._insert_batch, reachable)
+            report["added"] = added
+            # Уже есть в places (например, импортирован до перезапуска другим процессом)
+            report["duplicates"] += len(reachable) - added
+        
+        report["elapsed"] = time.perf_counter() - started
+        logger.info(
+            f"📥 Импорт источников: добавлено {report['added']} из {report['total']} "
+            f"за {report['elapsed']:.1f} с"
+        )
+        return report
+    
+    @staticmethod
+    def _insert_batch(reachable: List[Tuple[str, str, Dict[str, Any]]]) -> int:
+        """Одна транзакция для мест и одно обновление базы ссылок; возвращает число новых мест"""
+        places = []
+        for category, url, parsed in reachable:
+            contacts = parsed.get("contacts", {})
+            address = contacts.get("address")
+            address = address[:300] if address and address != "Не указано" else None
+            # Из кэша страниц пара приходит списком (JSON)
+            found = contacts.get("coordinates")
+            coordinates = tuple(found) if isinstance(found, (list, tuple)) else geocode(address or "", parsed["title"], parsed["content"])
+            places.append({
+                "name": parsed["title"][:200],
+                "description": parsed["content"][:1000] or None,
+                "category": category,
+                "address": address,
+                "source_url": url.rstrip('/'),
+                "latitude": coordinates[0] if coordinates else None,
+                "longitude": coordinates[1] if coordinates else None,
+            })
+        
+        with Session() as session:
+            inserted = session.execute(
+                insert(Place).values(places)
+                .on_conflict_do_nothing(index_elements=['category', 'source_url'])
+                .returning(Place.category, Place.source_url)
+            ).all()
+            session.commit()
+        
+        for category, url in inserted:
+            AdminService.register_source(category, url)
+        return len(inserted)
+    
+    @staticmethod
+    def restore_sources() -> int:
+        """Возвращает в базу ссылок источники, импортированные в прошлых запусках (они живут в places)"""
+        with Session() as session:
+            rows = session.execute(text(
+                "SELECT DISTINCT category, source_url FROM places WHERE source_url IS NOT NULL"
+            )).all()
+        
+        restored = sum(AdminService.register_source(category, url) for category, url in rows)
+        if restored:
+            logger.info(f"📥 Восстановлено импортированных источников: {restored}")
+        return restored
+
 class AdminService:
+    # Индекс (категория, url) для проверки дублей без линейного поиска по спискам
+    _url_index = None
+    
+    @staticmethod
+    def _get_url_index() -> set:
+        if AdminService._url_index is None:
+            AdminService._url_index = {
+                (category, url.rstrip('/'))
+                for category, urls in config.URL_DATABASE.items()
+                for url in urls
+            }
+        return AdminService._url_index
+    
+    @staticmethod
+    def has_url(category: str, url: str) -> bool:
+        """Есть ли ссылка в категории"""
+        return (category, url.rstrip('/')) in AdminService._get_url_index()
+    
+    @staticmethod
+    def register_source(category: str, url: str) -> bool:
+        """Добавляет уже сохраненный в places источник в базу ссылок, если его там нет"""
+        if category not in config.URL_DATABASE or AdminService.has_url(category, url):
+            return False
+        config.URL_DATABASE[category].append(url)
+        AdminService._get_url_index().add((category, url.rstrip('/')))
+        return True
+    
     @staticmethod
     def add_url_to_category(category: str, url: str):
         """Добавляет ссылку в базу"""
         if category in config.URL_DATABASE:
-            if url not in config.URL_DATABASE[category]:
+            if not AdminService.has_url(category, url):
                 config.URL_DATABASE[category].append(url)
+                AdminService._get_url_index().add((category, url.rstrip('/')))
                 logger.info(f"✅ Добавлена ссылка: {category} - {url}")
                 return True
         return False
@@ -284,15 +1070,12 @@ class AdminService:
     
     @staticmethod
     def get_detailed_stats() -> Dict[str, Any]:
-        """Подробная статистика"""
-        stats = {}
-        
+        """Подробная статистика из счетчиков (одно чтение маленькой таблицы)"""
         with Session() as session:
-            stats['total_users'] = session.query(User).count()
-            stats['total_admins'] = session.query(User).filter_by(role='admin').count()
-            stats['total_places'] = session.query(Place).count()
-            stats['active_places'] = session.query(Place).filter_by(is_active=True).count()
-            stats['total_reviews'] = session.query(Review).count()
-            stats['moderated_reviews'] = session.query(Review).filter_by(is_moderated=True).count()
+            stats = dict(session.query(StatsCounter.name, StatsCounter.value).all())
+            
+            # Счетчики еще не заполнены (init_db не запускался после обновления) - один агрегатный запрос
+            if not stats.keys() >= set(STATS_COUNTERS):
+                stats = dict(session.execute(text(STATS_AGGREGATE_SQL)).mappings().one())
         
         return stats
\ No newline at end of file
@@ -0,0 +1,173 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+import redis
+from sqlalchemy.dialects.postgresql import insert
+
+from config import config
+from database import Session, User
+from services import CacheService
+
+logger = logging.getLogger(__name__)
+
+# Растет при каждой смене роли; процессы бота сверяют его вместо запроса к БД
+ROLES_VERSION_KEY = 'roles:version'
+
+def set_role(telegram_id: str, role: str, username: str = None):
+    """Назначает роль (создавая пользователя) и сбрасывает кэш ролей во всех процессах бота"""
+    values = {"telegram_id": telegram_id, "role": role}
+    if username:
+        values["username"] = username
+
+    with Session() as session:
+        session.execute(
+            insert(User).values(**values).on_conflict_do_update(
+                index_elements=['telegram_id'],
+                set_={key: value for key, value in values.items() if key != 'telegram_id'}
+            )
+        )
+        session.commit()
+
+    client = CacheService().redis
+    if client:
+        client.incr(ROLES_VERSION_KEY)
+    else:
+        logger.warning(f"⚠️ Redis не подключен: бот увидит новую роль через {config.ROLE_CACHE_TTL} с")
+
+class UserDirectory:
+    """Роли и регистрация пользователей без обращений к БД на горячем пути"""
+
+    def __init__(self, cache: CacheService = None):
+        self.cache = cache or CacheService()
+
+        self._admins: Optional[Set[str]] = None
+        self._roles_version = None
+        self._roles_loaded_at = 0.0
+        self._roles_checked_at = 0.0
+        self._roles_lock = asyncio.Lock()
+
+        # Известные процессу пользователи и ожидающие записи в БД
+        # LRU ограниченного размера: память не растет с числом всех когда-либо писавших пользователей
+        self._known: OrderedDict[str, None] = OrderedDict()
+        self._pending: Dict[str, Optional[str]] = {}
+        self._flush_now = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+
+        self.registered = 0
+        self.flushes = 0
+
+    @property
+    def redis(self):
+        return self.cache.redis
+
+    async def is_admin(self, telegram_id: str) -> bool:
+        if self._roles_outdated():
+            loaded_at = self._roles_loaded_at
+            async with self._roles_lock:
+                # Пока ждали блокировку, роли мог перечитать другой хендлер
+                if self._roles_loaded_at == loaded_at:
+                    await self._reload_roles()
+        return telegram_id in self._admins
+
+    def _roles_outdated(self) -> bool:
+        """Версию ролей в Redis сверяем раз в ROLE_CHECK_INTERVAL; без Redis перечитываем по TTL"""
+        if self._admins is None:
+            return True
+
+        now = time.monotonic()
+        if now - self._roles_checked_at < config.ROLE_CHECK_INTERVAL:
+            return False
+        self._roles_checked_at = now
+
+        if self.redis:
+            try:
+                return self.redis.get(ROLES_VERSION_KEY) != self._roles_version
+            except redis.RedisError as e:
+                logger.warning(f"⚠️ Не удалось проверить версию ролей: {e}")
+
+        return now - self._roles_loaded_at > config.ROLE_CACHE_TTL
+
+    async def _reload_roles(self):
+        version = None
+        if self.redis:
+            try:
+                version = self.redis.get(ROLES_VERSION_KEY)
+            except redis.RedisError:
+                pass
+
+        self._admins = await asyncio.to_thread(self._load_admins)
+        self._roles_version = version
+        self._roles_loaded_at = self._roles_checked_at = time.monotonic()
+        logger.info(f"👮 Кэш ролей обновлен: админов {len(self._admins)}")
+
+    @staticmethod
+    def _load_admins() -> Set[str]:
+        with Session() as session:
+            return {telegram_id for (telegram_id,) in session.query(User.telegram_id).filter_by(role='admin')}
+
+    def register(self, telegram_id: str, username: Optional[str]):
+        """Регистрация по /start: в БД попадет пачкой, повторный /start ничего не стоит"""
+        if telegram_id in self._known:
+            self._known.move_to_end(telegram_id)
+            return
+
+        self._known[telegram_id] = None
+        if len(self._known) > config.USER_KNOWN_CACHE_SIZE:
+            self._known.popitem(last=False)
+        self._pending[telegram_id] = username
+        self.registered += 1
+        if len(self._pending) >= config.USER_FLUSH_BATCH:
+            self._flush_now.set()
+
+    def start(self):
+        """Запускается из работающего event loop"""
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        """Останавливает фоновую запись и дописывает буфер"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=config.USER_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    async def ensure_saved(self, telegram_id: str):
+        """Дописывает буфер, если пользователь еще не в БД: UPDATE его строки иначе ничего не изменит"""
+        # Идущая запись уже забрала пользователя из буфера, но еще не закоммитила - ждем ее
+        if telegram_id in self._pending or self._flush_lock.locked():
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            batch, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._insert_users, [
+                    {"telegram_id": telegram_id, "username": username} for telegram_id, username in batch.items()
+                ])
+                self.flushes += 1
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи пользователей: {e}")
+                # Вернем в буфер, не затирая более свежие записи
+                self._pending = {**batch, **self._pending}
+
+    @staticmethod
+    def _insert_users(rows: List[Dict[str, Optional[str]]]):
+        """Идемпотентная вставка: существующие пользователи (и их роли) не меняются"""
+        with Session() as session:
+            session.execute(insert(User).values(rows).on_conflict_do_nothing(index_elements=['telegram_id']))
+            session.commit()
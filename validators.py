@@ -13,6 +13,10 @@ def is_valid_telegram_id(telegram_id: str) -> bool:
     """Проверка валидности Telegram ID"""
     return telegram_id.isdigit() and len(telegram_id) >= 5
 
+def is_valid_rating(rating: str) -> bool:
+    """Проверка, что оценка - целое число от 1 до 5"""
+    return rating.isdigit() and 1 <= int(rating) <= 5
+
 def is_valid_category(category: str, available_categories: list) -> bool:
     """Проверка, что категория существует"""
     return category in available_categories
@@ -28,4 +32,12 @@ def sanitize_text(text: str, max_length: int = 1000) -> str:
     if len(text) > max_length:
         text = text[:max_length] + "..."
     
-    return text.strip()
\ No newline at end of file
+    return text.strip()
+
+def escape_markdown(text: str) -> str:
+    """Экранирование разметки Telegram Markdown в тексте вне сущностей"""
+    return re.sub(r'([_*`\[])', r'\\\1', text)
+
+def markdown_bold(text: str) -> str:
+    """Жирный текст: внутри сущности экранирование не работает, поэтому звездочки убираются"""
+    return f"*{text.replace('*', '')}*"